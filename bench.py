@@ -0,0 +1,836 @@
+'''
+Benchmarks of JollyCoin/JLC node internals.
+
+Usage:
+    python bench.py pow
+    python bench.py loop-lag
+    python bench.py verify
+    python bench.py memory
+    python bench.py wire
+    python bench.py json
+    python bench.py ingest
+    python bench.py merkle
+    python bench.py index
+    python bench.py db --db <uri of empty scratch database>
+'''
+import time
+import json
+import random
+import hashlib
+import asyncio
+import argparse
+import pstats
+import cProfile
+import resource
+import tracemalloc
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, or_
+from dateutil.relativedelta import relativedelta
+
+from jollycoin.block import Block
+from jollycoin.transaction import Transaction
+from jollycoin import crypto
+from jollycoin import miner
+from jollycoin import sha256_numpy
+from jollycoin import wire
+from jollycoin import codec
+from jollycoin import merkle
+
+
+def make_transactions(n: int, signed: bool=False) -> list:
+    # unless signed, sign once and reuse signature, benchmarks do not verify it
+    sk, pk, addr = crypto.generate_private_public_address_key()
+    signature = crypto.sign_message(sk, '{}')
+    transactions = []
+
+    for i in range(n):
+        tx = Transaction(
+            version='1.0',
+            id_=Transaction.gen_random_id(),
+            time_=Transaction.get_time_now(),
+            sender_address=addr,
+            recipient_address=addr,
+            sender_public_key=pk,
+            amount=1_000_000 + i,
+            fee=1_000,
+            signature=signature,
+            hash_=None,
+            check=False,
+        )
+
+        if signed:
+            tx.sign(sk)
+
+        tx.hash = tx.calc_hash()
+        transactions.append(tx)
+
+    return transactions
+
+
+def make_block(n_transactions: int, difficulty: int=0, signed: bool=False) -> Block:
+    b = Block(
+        version='1.0',
+        height=1,
+        id_=Block.gen_random_id(),
+        prev_hash=Block.gen_random_id(),
+        time_=Block.get_time_now(),
+        transactions=make_transactions(n_transactions, signed),
+        merkle_root=None,
+        difficulty=difficulty,
+        nonce=None,
+        hash_=None,
+        check=False,
+    )
+
+    b.merkle_root = b.calc_merkel_root()
+    return b
+
+
+def _legacy_hashes(m: bytes, difficulty: int, n_hashes: int):
+    # nonce loop as it was before sha256_prefix
+    sha256 = crypto.sha256
+
+    for nonce in range(n_hashes):
+        n = miner.nonce_to_bytes(nonce)
+        h = sha256()
+        h.update(m)
+        h.update(n)
+        hd = h.hexdigest()
+        d = int(hd, 16)
+
+        if d < difficulty:
+            break
+
+
+def _prefix_hashes(m: bytes, difficulty: int, n_hashes: int):
+    intdigest = crypto.sha256_prefix(m).intdigest
+    nonce_to_bytes = miner.nonce_to_bytes
+
+    for nonce in range(n_hashes):
+        if intdigest(nonce_to_bytes(nonce)) < difficulty:
+            break
+
+
+def bench_pow(args):
+    for n_transactions in (1, 200, 5_000):
+        b = make_block(n_transactions)
+        m = json.dumps(b.to_dict(without=['nonce', 'hash'])).encode()
+
+        for name, f, n_hashes in (('before', _legacy_hashes, max(200, 20_000_000 // len(m))),
+                                  ('after', _prefix_hashes, 1_000_000)):
+            t = time.perf_counter()
+            # difficulty 1 is practically never met, so all hashes are calculated
+            f(m, 1, n_hashes)
+            dt = time.perf_counter() - t
+            print(f'pow n_transactions: {n_transactions:>5}, preimage: {len(m):>8} bytes, {name:>6}: {n_hashes / dt:>12.0f} hashes/sec')
+
+        if sha256_numpy.available:
+            t = time.perf_counter()
+            search = sha256_numpy.NonceSearch(m, 1)
+            setup_dt = time.perf_counter() - t
+
+            n_hashes = 1_000_000
+            t = time.perf_counter()
+            search.search(0, n_hashes)
+            dt = time.perf_counter() - t
+            print(f'pow n_transactions: {n_transactions:>5}, preimage: {len(m):>8} bytes, {"numpy":>6}: {n_hashes / dt:>12.0f} hashes/sec, midstate {setup_dt:.3f} sec')
+
+
+async def _tick(lags: list, done: asyncio.Event, interval: float):
+    while not done.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - t - interval)
+
+
+async def _mine_measuring_lag(block: Block, executor: ThreadPoolExecutor=None) -> list:
+    lags = []
+    done = asyncio.Event()
+    ticker = asyncio.ensure_future(_tick(lags, done, 0.01))
+    await asyncio.sleep(0.1)
+
+    if executor:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(executor, block.mine, 1)
+    else:
+        block.mine(1)
+
+    done.set()
+    await ticker
+    return lags
+
+
+def bench_loop_lag(args):
+    # expected ~1M hashes per block
+    difficulty = 2 ** 256 // 1_000_000
+    executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_event_loop()
+
+    for name, e in (('before', None), ('after', executor)):
+        block = make_block(200, difficulty)
+        t = time.perf_counter()
+        lags = loop.run_until_complete(_mine_measuring_lag(block, e))
+        dt = time.perf_counter() - t
+        lags = sorted(lags)
+        p50 = lags[len(lags) // 2]
+        p99 = lags[int(len(lags) * 0.99)]
+        print(f'loop-lag {name:>6}: mining {dt:.2f} sec, ticks {len(lags)}, p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, max {lags[-1] * 1000:.2f} ms')
+
+
+def bench_verify(args):
+    # repeated senders, e.g. exchanges
+    n_senders = 10
+    n_messages = 200
+    items = []
+
+    for i in range(n_senders):
+        sk, pk, addr = crypto.generate_private_public_address_key()
+
+        for j in range(n_messages):
+            message = json.dumps({'sender': addr, 'n': j})
+            items.append((pk, crypto.sign_message(sk, message), message))
+
+    for name in ('before', 'after'):
+        crypto._load_public_key.cache_clear()
+        t = time.perf_counter()
+
+        for pk, signature, message in items:
+            if name == 'before':
+                # no parsed public key reuse
+                crypto._load_public_key.cache_clear()
+
+            assert crypto.verify_message(pk, signature, message)
+
+        dt = time.perf_counter() - t
+        print(f'verify {name:>6}: {len(items) / dt:>8.0f} verifications/sec')
+
+    t = time.perf_counter()
+    assert all(crypto.verify_many(items))
+    dt = time.perf_counter() - t
+    print(f'verify  batch: {len(items) / dt:>8.0f} verifications/sec, verify_many')
+
+    print(f'verify key cache: {crypto.get_key_cache_info()!r}')
+
+
+class _DictTransaction:
+    # transaction as it was before slots, attributes in per instance dict
+    def __init__(self, data: dict):
+        for k in Transaction.__slots__:
+            if not k.startswith('_'):
+                setattr(self, k, data[k])
+
+
+class _DictBlock:
+    # block as it was before slots, attributes in per instance dict
+    def __init__(self, data: dict):
+        for k in Block.__slots__:
+            if not k.startswith('_'):
+                setattr(self, k, data[k])
+
+
+def _random_hex(n_bytes: int) -> str:
+    return random.getrandbits(n_bytes * 8).to_bytes(n_bytes, byteorder='big').hex()
+
+
+def make_blocks_page(n_blocks: int=15_000, n_transactions: int=3) -> str:
+    # range response as sent by coordinator, signatures are not valid
+    blocks = []
+
+    for i in range(n_blocks):
+        transactions = []
+
+        for j in range(n_transactions):
+            transactions.append({
+                'version': '1.0',
+                'id': _random_hex(32),
+                'time': Transaction.get_time_now(),
+                'sender_address': None if j == 0 else 'J' + _random_hex(32),
+                'recipient_address': 'J' + _random_hex(32),
+                'sender_public_key': None if j == 0 else '04' + _random_hex(64),
+                'amount': random.randint(0, 10 ** 12),
+                'fee': 0 if j == 0 else 1_000,
+                'signature': None if j == 0 else _random_hex(71),
+                'hash': _random_hex(32),
+            })
+
+        blocks.append({
+            'version': '1.0',
+            'height': i,
+            'id': _random_hex(32),
+            'prev_hash': _random_hex(32),
+            'time': Block.get_time_now(),
+            'transactions': transactions,
+            'merkle_root': _random_hex(32),
+            'difficulty': 0x00000fffffffffff_ffffffffffffffff_ffffffffffffffff_ffffffffffffffff,
+            'nonce': random.randint(0, 2 ** 24),
+            'hash': _random_hex(32),
+        })
+
+    return json.dumps({'status': 'success', 'blocks': blocks})
+
+
+def _materialize_blocks(message: str, variant: str) -> list:
+    data = json.loads(message)
+    blocks = []
+
+    for block_data in data['blocks']:
+        if variant == 'before':
+            block_data['transactions'] = [_DictTransaction(tx_data) for tx_data in block_data['transactions']]
+            b = _DictBlock(block_data)
+        else:
+            block_data['transactions'] = [Transaction.from_dict(tx_data, check=False) for tx_data in block_data['transactions']]
+            b = Block(
+                version=block_data['version'],
+                height=block_data['height'],
+                id_=block_data['id'],
+                prev_hash=block_data['prev_hash'],
+                time_=block_data['time'],
+                transactions=block_data['transactions'],
+                merkle_root=block_data['merkle_root'],
+                difficulty=block_data['difficulty'],
+                nonce=block_data['nonce'],
+                hash_=block_data['hash'],
+                check=False,
+            )
+
+        blocks.append(b)
+
+    return blocks
+
+
+def _peak_rss(message: str, variant: str, results: multiprocessing.Queue):
+    blocks = _materialize_blocks(message, variant)
+    # kilobytes on linux
+    results.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+
+def bench_memory(args):
+    n_blocks = 15_000
+    n_transactions = 3
+    message = make_blocks_page(n_blocks, n_transactions)
+    ctx = multiprocessing.get_context('spawn')
+
+    for variant in ('before', 'after'):
+        # bytes per object
+        data = json.loads(message)
+        tx_data = [tx for b in data['blocks'] for tx in b['transactions']]
+        tracemalloc.start()
+
+        if variant == 'before':
+            txs = [_DictTransaction(d) for d in tx_data]
+        else:
+            txs = [Transaction.from_dict(d, check=False) for d in tx_data]
+
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del txs
+
+        # peak rss of materializing whole page, in clean process
+        results = ctx.Queue()
+        p = ctx.Process(target=_peak_rss, args=(message, variant, results))
+        p.start()
+        rss = results.get()
+        p.join()
+
+        print(f'memory {variant:>6}: {size / len(tx_data):>6.0f} bytes/transaction, peak rss {rss / 2 ** 20:>6.1f} MiB for {n_blocks} blocks x {n_transactions} transactions')
+
+
+def _best_time(f, *args, repeat: int=3) -> float:
+    best = None
+
+    for i in range(repeat):
+        t = time.perf_counter()
+        f(*args)
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+
+    return best
+
+
+def bench_wire(args):
+    # range response, parsing only
+    message = make_blocks_page(15_000, 3)
+    blocks_data = json.loads(message)['blocks']
+    wire_message = wire.encode_blocks(blocks_data)
+    assert wire.decode_blocks(wire_message) == blocks_data
+
+    for name, f, m in (('json', json.loads, message), ('binary', wire.decode_blocks, wire_message)):
+        dt = _best_time(f, m)
+        print(f'wire get-range {name:>6}: {len(m):>10} bytes, decode {dt:.3f} sec for 15000 blocks x 3 transactions')
+
+    # mined block with valid signatures, decoded into verified Block,
+    # signatures are verified once, then served from verified cache
+    b = make_block(200, 2 ** 256 // 1_000, signed=True).mine()
+    message = b.serialize()
+    wire_message = b.serialize_wire()
+    assert Block.deserialize_wire(wire_message).verify()
+    assert Block.deserialize_wire(wire_message).serialize() == message
+    n = 50
+
+    for name, f, m in (('json', Block.deserialize, message), ('binary', Block.deserialize_wire, wire_message)):
+        f(m)
+        dt = _best_time(lambda: [f(m) for i in range(n)])
+        print(f'wire block     {name:>6}: {len(m):>10} bytes, deserialize {dt / n * 1000:.2f} ms per block of 200 transactions')
+
+
+def bench_json(args):
+    print(f'json fast codec available: {codec.available}')
+    message = make_blocks_page(15_000, 3)
+    blocks_data = json.loads(message)['blocks']
+    transactions_data = [tx_data for block_data in blocks_data for tx_data in block_data['transactions']]
+
+    # block range response, as encoded by node
+    response = {'status': 'success', 'blocks': blocks_data, 'n_blocks': len(blocks_data)}
+    dt = _best_time(json.dumps, response)
+    print(f'json blocks range        json encode: {dt:.3f} sec')
+
+    def encode_fast():
+        # node wraps difficulty of freshly built block dicts, copies stand in for them
+        blocks = [dict(block_data, difficulty=codec.wide_int(block_data['difficulty'])) for block_data in blocks_data]
+        return codec.dumps({'status': 'success', 'blocks': blocks, 'n_blocks': len(blocks)})
+
+    dt = _best_time(encode_fast)
+    assert json.loads(encode_fast()) == json.loads(json.dumps(response))
+    print(f'json blocks range       codec encode: {dt:.3f} sec')
+
+    # transactions range, no integers wider than 64 bits
+    response = {'status': 'success', 'transactions': transactions_data, 'n_transactions': len(transactions_data)}
+
+    for name, f in (('json', json.dumps), ('codec', codec.dumps)):
+        dt = _best_time(f, response)
+        print(f'json transactions range {name:>6} encode: {dt:.3f} sec')
+
+
+def _ingest(message: str):
+    # as coordinator does on submitted block: create, verify, store
+    b = Block.from_dict(json.loads(message)['block'])
+    assert b.verify()
+    b.get_transactions_message()
+    b.serialize()
+
+
+def bench_ingest(args):
+    for n_transactions in (200, 2_000):
+        b = make_block(n_transactions, 2 ** 256 // 1_000, signed=True).mine()
+        message = json.dumps({'block': b.to_dict()})
+
+        # signatures are verified once, then served from verified cache
+        _ingest(message)
+        profile = cProfile.Profile()
+        profile.runcall(_ingest, message)
+        stats = pstats.Stats(profile).stats
+
+        # full json encodings, not counting scalars
+        n_encodings = sum(v[1] for (f, l, name), v in stats.items() if name == 'iterencode')
+
+        dt = _best_time(_ingest, message)
+        print(f'ingest n_transactions: {n_transactions:>5}, json encodings: {n_encodings:>5}, {dt * 1000:.2f} ms per block')
+
+
+def _legacy_merkle_levels(leaves: list) -> list:
+    # merkle tree as it was before flat buffer, levels prepended
+    levels = [[bytearray.fromhex(v) for v in leaves]]
+
+    while len(levels[0]) > 1:
+        solo_leave = None
+        N = len(levels[0])
+
+        if N % 2 == 1:
+            solo_leave = levels[0][-1]
+            N -= 1
+
+        new_level = []
+
+        for l, r in zip(levels[0][0:N:2], levels[0][1:N:2]):
+            new_level.append(hashlib.sha256(l + r).digest())
+
+        if solo_leave is not None:
+            new_level.append(solo_leave)
+
+        levels = [new_level, ] + levels
+
+    return levels
+
+
+def _legacy_merkle_root(leaves: list) -> str:
+    return _legacy_merkle_levels(leaves)[0][0].hex()
+
+
+def _tree_merkle(leaves: list) -> merkle.Merkle:
+    m = merkle.Merkle()
+    m.add_leaf(leaves)
+    m.make_tree()
+    return m
+
+
+def _tree_merkle_root(leaves: list) -> str:
+    return _tree_merkle(leaves).get_merkle_root()
+
+
+def _flat_merkle(leaves: list) -> merkle.Merkle:
+    # tree with buffer of all levels, as used for proofs
+    m = _tree_merkle(leaves)
+    m.get_proof(0)
+    return m
+
+
+def _retained_size(f, *args) -> int:
+    tracemalloc.start()
+    r = f(*args)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del r
+    return size
+
+
+def _stream_merkle_root(leaves: list) -> str:
+    return merkle.merkle_root_hex(leaves)
+
+
+def bench_merkle(args):
+    for n_leaves in (10, 1_000, 100_000, 1_000_000):
+        leaves = [_random_hex(32) for i in range(n_leaves)]
+        r = _legacy_merkle_root(leaves)
+        assert _tree_merkle_root(leaves) == r
+        assert _stream_merkle_root(leaves) == r
+        repeat = max(3, min(1_000, 100_000 // n_leaves))
+
+        results = [
+            f'{name}: {_best_time(f, leaves, repeat=repeat) * 1000:9.3f} ms'
+            for name, f in (('legacy', _legacy_merkle_root), ('tree', _tree_merkle_root), ('root', _stream_merkle_root), ('levels', _flat_merkle))
+        ]
+
+        print(f'merkle n_leaves: {n_leaves:>9}, ' + ', '.join(results))
+
+        # memory of whole tree, leaves included
+        legacy_size = _retained_size(_legacy_merkle_levels, leaves)
+        tree_size = _retained_size(_flat_merkle, leaves)
+        print(f'merkle n_leaves: {n_leaves:>9}, tree size legacy: {legacy_size / 2 ** 20:.2f} MB, flat: {tree_size / 2 ** 20:.2f} MB')
+
+        # block template grows by one transaction
+        accumulator = merkle.MerkleAccumulator()
+        accumulator.add_leaves(bytes.fromhex(v) for v in leaves)
+        assert accumulator.get_merkle_root() == r
+        leaf = _random_hex(32)
+
+        def _append_leaf():
+            m = accumulator.copy()
+            m.add_leaf(bytes.fromhex(leaf))
+            return m.get_merkle_root()
+
+        rebuild_dt = _best_time(_stream_merkle_root, leaves + [leaf], repeat=repeat)
+        append_dt = _best_time(_append_leaf, repeat=repeat)
+        print(f'merkle n_leaves: {n_leaves:>9}, one more leaf, rebuild: {rebuild_dt * 1000:9.3f} ms, accumulator: {append_dt * 1000:.3f} ms')
+
+
+def _legacy_get_transaction(b: Block, transaction_id: str) -> Transaction:
+    # linear scan as it was before transactions index
+    for tx in b.transactions:
+        if tx.id == transaction_id:
+            return tx
+
+    raise ValueError(f'unknown transaction id {transaction_id!r}')
+
+
+def _lookup_all(get_transaction, b: Block, transactions_ids: list):
+    for transaction_id in transactions_ids:
+        get_transaction(b, transaction_id)
+
+
+def bench_index(args):
+    for n_transactions in (100, 1_000, 10_000):
+        b = make_block(n_transactions)
+        transactions_ids = [tx.id for tx in b.transactions]
+        random.shuffle(transactions_ids)
+
+        legacy_dt = _best_time(_lookup_all, _legacy_get_transaction, b, transactions_ids)
+        b.transactions = list(b.transactions)
+        first_dt = _best_time(_lookup_all, Block.get_transaction, b, transactions_ids, repeat=1)
+        index_dt = _best_time(_lookup_all, Block.get_transaction, b, transactions_ids)
+        print(f'index n_transactions: {n_transactions:>6}, lookup of all ids, linear: {legacy_dt * 1000:9.2f} ms, index: {index_dt * 1000:.2f} ms, index incl. build: {first_dt * 1000:.2f} ms')
+
+
+def _seed_v1_chain(db, n_blocks: int, n_transfers: int, miner_address: str, addresses: list, now: datetime) -> int:
+    # chain spread over 3 years, rewards go to single payout address which
+    # also sends, sometimes to itself, half of transfers are stored without
+    # block id, same as v1 nodes stored transactions confirmed from mempool
+    span = timedelta(days=3 * 365)
+    blocks_rows = []
+    transactions_rows = []
+    n_rows = 0
+
+    def _transaction_row(block_id, confirmed, time_dt, sender_address, recipient_address, amount, fee):
+        return {
+            'id': _random_hex(32),
+            'block_id': block_id,
+            'confirmed': confirmed,
+            'version': '1.0',
+            'time': time_dt.isoformat(),
+            'time_dt': time_dt,
+            'time_ts': int(time_dt.timestamp()),
+            'sender_address': sender_address,
+            'recipient_address': recipient_address,
+            'sender_public_key': None,
+            'signature': None,
+            'hash': _random_hex(32),
+            'amount': amount,
+            'fee': fee,
+        }
+
+    def _flush():
+        session = db.Session()
+        session.bulk_insert_mappings(db.BlockModelV1, blocks_rows)
+        session.bulk_insert_mappings(db.TransactionModelV1, transactions_rows)
+        session.commit()
+        session.close()
+        blocks_rows.clear()
+        transactions_rows.clear()
+
+    for height in range(n_blocks):
+        time_dt = now - span * (n_blocks - height) / n_blocks
+        block_id = _random_hex(32)
+        rows = [_transaction_row(block_id, True, time_dt, None, miner_address, 1_000_000, 0)]
+
+        for i in range(n_transfers):
+            sender_address = miner_address if i == 0 else random.choice(addresses)
+            recipient_address = miner_address if i == 0 and height % 10 == 0 else random.choice(addresses)
+            rows.append(_transaction_row(block_id if i % 2 else None, True, time_dt, sender_address, recipient_address, random.randint(1, 10_000), 1_000))
+
+        blocks_rows.append({
+            'version': '1.0',
+            'height': height,
+            'id': block_id,
+            'prev_hash': _random_hex(32),
+            'time': time_dt.isoformat(),
+            'time_dt': time_dt,
+            'time_ts': int(time_dt.timestamp()),
+            # only ids of transactions are read by migration
+            'transactions': json.dumps([{'id': r['id'], 'hash': r['hash']} for r in rows]),
+            'merkle_root': _random_hex(32),
+            'hash': _random_hex(32),
+            'difficulty': 2 ** 236 - 1,
+            'nonce': random.getrandbits(64),
+        })
+
+        transactions_rows.extend(rows)
+        n_rows += len(rows)
+
+        if len(blocks_rows) == 1_000:
+            _flush()
+
+    # mempool of last hour
+    for i in range(500):
+        time_dt = now - timedelta(seconds=random.randint(0, 3_600))
+        transactions_rows.append(_transaction_row(None, False, time_dt, random.choice(addresses), miner_address, random.randint(1, 10_000), 1_000))
+
+    n_rows += 500
+    _flush()
+    return n_rows
+
+
+def _legacy_volume_since(session, model, since: list) -> list:
+    # one SUM per window, as it was before bucketed query and rollups
+    volume = []
+
+    for dt in since:
+        q = session.query(func.sum(model.amount))
+        q = q.filter(model.confirmed == True)
+        q = q.filter(model.sender_address == None)
+        q = q.filter(model.time_dt >= dt)
+        volume.append(q.scalar() or 0.0)
+
+    return volume
+
+
+def _sum_supply(session, model):
+    q = session.query(func.sum(model.amount))
+    q = q.filter(model.confirmed == True)
+    q = q.filter(model.sender_address == None)
+    return q.scalar()
+
+
+def _sum_address_totals(session, model, address: str):
+    q = session.query(func.sum(model.amount), func.sum(model.fee))
+    q = q.filter(model.confirmed == True)
+    q = q.filter(model.sender_address == address)
+    total_sent, total_fee = q.one()
+
+    q = session.query(func.sum(model.amount))
+    q = q.filter(model.confirmed == True)
+    q = q.filter(model.recipient_address == address)
+    return q.scalar(), total_sent, total_fee
+
+
+def _count_valid_amounts(session, model):
+    # filter of unconfirmed transactions, compares text on v1 tables
+    q = session.query(func.count(model.id))
+    q = q.filter(model.amount >= 0)
+    q = q.filter(model.fee >= 0)
+    return q.scalar()
+
+
+def bench_db(args):
+    # database module connects on import, so it is imported once uri is set
+    from jollycoin.config import Config
+    Config.DB = args.db
+
+    from sqlalchemy import inspect
+    from jollycoin import db
+    from jollycoin import migrate
+    from jollycoin.blockchain import Blockchain, CHAIN_COUNTERS
+
+    session = db.Session()
+    table_names = inspect(db.engine).get_table_names()
+
+    if db.TransactionModelV1.__tablename__ in table_names or session.query(db.BlockModel.id).first() is not None:
+        raise SystemExit('db benchmark creates and fills tables, it needs empty scratch database')
+
+    db.Base.metadata.create_all(db.engine, tables=[db.TransactionModelV1.__table__, db.BlockModelV1.__table__])
+    blockchain = Blockchain()
+    now = datetime.utcnow()
+    miner_address = 'J' + _random_hex(32)
+    addresses = ['J' + _random_hex(32) for i in range(1_000)]
+    light_address = addresses[0]
+
+    t = time.perf_counter()
+    n_rows = _seed_v1_chain(db, args.n_blocks, args.n_transfers, miner_address, addresses, now)
+    print(f'db seeded v1 tables: {args.n_blocks} blocks, {n_rows} transactions, {time.perf_counter() - t:.1f} sec')
+
+    # same aggregates on integers stored as strings, before migration
+    before = {
+        'supply sum': _best_time(_sum_supply, session, db.TransactionModelV1),
+        'address totals': _best_time(_sum_address_totals, session, db.TransactionModelV1, miner_address),
+        'amount filter': _best_time(_count_valid_amounts, session, db.TransactionModelV1),
+    }
+
+    session.close()
+    t = time.perf_counter()
+    migrated = migrate.migrate_v1_tables()
+    print(f'db migrated v1 tables: {time.perf_counter() - t:.1f} sec, {migrated}')
+    session = db.Session()
+
+    after = {
+        'supply sum': _best_time(_sum_supply, session, db.TransactionModel),
+        'address totals': _best_time(_sum_address_totals, session, db.TransactionModel, miner_address),
+        'amount filter': _best_time(_count_valid_amounts, session, db.TransactionModel),
+    }
+
+    assert int(_sum_supply(session, db.TransactionModelV1)) == _sum_supply(session, db.TransactionModel)
+    assert _count_valid_amounts(session, db.TransactionModelV1) == _count_valid_amounts(session, db.TransactionModel)
+
+    for name in before:
+        print(f'db {name:<22} v1 strings: {before[name] * 1000:9.2f} ms, v2 integers: {after[name] * 1000:9.2f} ms')
+
+    # windows of /v1/stats: volume, hourly, daily and monthly volume
+    windows = [dt for k, dt in blockchain._get_volume_windows(now)]
+    history = [now - timedelta(hours=i) for i in range(24)] + [now - timedelta(days=i) for i in range(32)]
+    history += [now - relativedelta(months=i) for i in range(36)]
+
+    volume_windows = {}
+
+    for name, since in (('volume windows', windows), ('volume history', history)):
+        legacy = _legacy_volume_since(session, db.TransactionModel, since)
+        assert blockchain._query_volume_since(session, since) == legacy
+        volume_windows[name] = [
+            _best_time(_legacy_volume_since, session, db.TransactionModel, since),
+            _best_time(blockchain._query_volume_since, session, since),
+            legacy,
+            since,
+        ]
+
+    # address totals and chain totals, before rollups are built
+    addresses_totals = [blockchain._get_address_totals(session, a, True) for a in (miner_address, light_address)]
+    balance_before = [_best_time(blockchain._get_address_totals, session, a, True) for a in (miner_address, light_address)]
+    counters = blockchain._query_chain_counters(session)
+    counters_before = _best_time(blockchain._query_chain_counters, session)
+
+    for name, rebuild in (('volume rollups', blockchain.rebuild_volume_rollups),
+                          ('address balances', blockchain.rebuild_address_balances),
+                          ('chain counters', blockchain.rebuild_chain_counters)):
+        t = time.perf_counter()
+        rebuild(session)
+        session.commit()
+        print(f'db rebuilt {name}: {time.perf_counter() - t:.1f} sec')
+
+    for name, (legacy_dt, query_dt, legacy, since) in volume_windows.items():
+        assert blockchain._get_volume_since(session, since) == legacy
+        rollup_dt = _best_time(blockchain._get_volume_since, session, since)
+        print(f'db {name:<22} {len(since)} windows, query per window: {legacy_dt * 1000:9.2f} ms, bucketed query: {query_dt * 1000:9.2f} ms, rollups: {rollup_dt * 1000:9.2f} ms')
+
+    for name, a, totals, before_dt in zip(('payout', 'light'), (miner_address, light_address), addresses_totals, balance_before):
+        assert blockchain._get_address_totals(session, a, True) == totals
+        after_dt = _best_time(blockchain._get_address_totals, session, a, True)
+        print(f'db {"balance of " + name:<22} aggregates: {before_dt * 1000:9.2f} ms, address balance table: {after_dt * 1000:9.2f} ms')
+
+    get_counters = lambda: {name: blockchain._get_chain_counter(session, name) for name in CHAIN_COUNTERS}
+    assert get_counters() == counters
+    print(f'db {"chain counters":<22} count: {counters_before * 1000:9.2f} ms, counters table: {_best_time(get_counters) * 1000:9.2f} ms')
+
+    # address history of payout address
+    results = []
+
+    for name, kwargs in (('all', {}), ('page of 100', {'limit': 100}),
+                         ('summary', {'return_confirmed_transactions': False, 'return_unconfirmed_transactions': False})):
+        dt = _best_time(lambda: blockchain.get_address_info(session, miner_address, check=False, **kwargs), repeat=1 if not kwargs else 3)
+        results.append(f'{name}: {dt * 1000:9.2f} ms')
+
+    print(f'db {"payout address info":<22} ' + ', '.join(results))
+
+    # pages of payout address, sent and received transactions interleave
+    # within blocks, so every page merges both, compared to single query
+    for confirmed in (True, False):
+        q = session.query(db.TransactionModel.id)
+        q = blockchain._filter_address_transactions(q, confirmed)
+        q = q.filter(or_(db.TransactionModel.sender_address == miner_address, db.TransactionModel.recipient_address == miner_address))
+        q = q.order_by(db.TransactionModel.time_dt, db.TransactionModel.id)
+        expected = [r.id for r in q]
+        transactions_ids = []
+        cursor = None
+        n_pages = 0
+
+        while True:
+            transactions, cursor = blockchain.get_address_transactions(session, miner_address, confirmed, cursor, 97, check=False)
+            transactions_ids.extend(tx.id for tx in transactions)
+            n_pages += 1
+
+            if cursor is None:
+                break
+
+        assert transactions_ids == expected, 'pages of address transactions differ from its history'
+        assert blockchain._get_address_n_transactions(session, miner_address, confirmed) == len(expected)
+        print(f'db {"payout address pages":<22} {"confirmed" if confirmed else "unconfirmed"}: {len(expected)} transactions in {n_pages} pages match history')
+
+    # deep page of confirmed transactions
+    depth = n_rows // 2
+    transactions, cursor = blockchain.get_transactions_range(session, depth - 100, depth)
+    offset_page = lambda: blockchain.get_transactions_range(session, depth, depth + 100)
+    cursor_page = lambda: blockchain.get_transactions_range(session, 0, 100, cursor=cursor)
+    assert [tx.id for tx in offset_page()[0]] == [tx.id for tx in cursor_page()[0]]
+    print(f'db {"transactions page":<22} at {depth}, offset: {_best_time(offset_page) * 1000:9.2f} ms, cursor: {_best_time(cursor_page) * 1000:9.2f} ms')
+
+    session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='JollyCoin/JLC Benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+    subparsers.add_parser('pow', help='proof-of-work hashes/sec').set_defaults(f=bench_pow)
+    subparsers.add_parser('loop-lag', help='event loop lag while mining').set_defaults(f=bench_loop_lag)
+    subparsers.add_parser('verify', help='signature verifications/sec for repeated senders').set_defaults(f=bench_verify)
+    subparsers.add_parser('memory', help='memory of materialized blocks range').set_defaults(f=bench_memory)
+    subparsers.add_parser('wire', help='payload size and decode time of json and binary wire format').set_defaults(f=bench_wire)
+    subparsers.add_parser('json', help='json codec encode time of large range responses').set_defaults(f=bench_json)
+    subparsers.add_parser('ingest', help='json encodings and time of submitted block ingest').set_defaults(f=bench_ingest)
+    subparsers.add_parser('merkle', help='merkle root time of legacy, flat tree, root only and incremental builders').set_defaults(f=bench_merkle)
+    subparsers.add_parser('index', help='transaction lookups by id in large blocks').set_defaults(f=bench_index)
+    db_parser = subparsers.add_parser('db', help='aggregates of v1 and v2 tables, rollups, counters and pages on seeded chain')
+    db_parser.add_argument('--db', required=True, help='URI of empty scratch database, tables are created and filled')
+    db_parser.add_argument('--n-blocks', type=int, default=20_000)
+    db_parser.add_argument('--n-transfers', type=int, default=9, help='transfers per block, besides reward')
+    db_parser.set_defaults(f=bench_db)
+    args = parser.parse_args()
+    args.f(args)
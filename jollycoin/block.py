@@ -1,14 +1,17 @@
 from decimal import Decimal
 from datetime import datetime
 from collections import OrderedDict
-from typing import List, Dict, Sequence, TypeVar
-import math
+from typing import List, Dict, Sequence, Callable, TypeVar
 import json
 import random
+import operator
 
-from .transaction import Transaction
-from .merkle import Merkle
+from .transaction import Transaction, TransactionError
+from .merkle import merkle_root_hex
 from . import crypto
+from . import wire
+from . import codec
+from . import miner
 
 
 # we require it defined like this because of python3.6
@@ -20,7 +23,32 @@ class BlockError(Exception):
     pass
 
 
+# nonce is part of consensus, it must fit in 256 bits,
+# so it can be stored as fixed size bytes
+MAX_NONCE = 2 ** 256 - 1
+
+
 class Block:
+    # NOTE: slots instead of per instance dict, sync materializes
+    #       up to 15,000 blocks at once
+    __slots__ = (
+        'version',
+        'height',
+        'id',
+        'prev_hash',
+        'time',
+        'transactions',
+        'merkle_root',
+        'difficulty',
+        'nonce',
+        'hash',
+        # cached canonical preimages, see `_get_cache`
+        '_cache',
+        # cached transaction id to index map, see `_get_transactions_index`
+        '_transactions_index',
+    )
+
+
     def __init__(self: Block,
                  version: str,
                  height: int,
@@ -44,6 +72,8 @@ class Block:
         self.difficulty = difficulty
         self.nonce = nonce
         self.hash = hash_
+        self._cache = None
+        self._transactions_index = None
 
         if check:
             if not self.verify_hash():
@@ -60,6 +90,33 @@ class Block:
         return f'<{self.__class__.__name__} id: {self.id!r}, prev_hash: {self.prev_hash!r}, *n_transactions: {len(self.transactions)}, nonce: {self.nonce!r}, hash: {self.hash!r}>'
 
 
+    def _get_cache(self: Block) -> Dict:
+        '''
+        Returns cache of canonical preimages, it is dropped once any field
+        they are built from is replaced, same as `Transaction._get_cache`.
+        Transactions are compared by their serialized messages, which are
+        cached by transactions themselves. Nonce and hash are not compared,
+        values derived from them are cached together with them.
+        '''
+        fields = (
+            self.version,
+            self.height,
+            self.id,
+            self.prev_hash,
+            self.time,
+            self.merkle_root,
+            self.difficulty,
+            *[tx.serialize() for tx in self.transactions],
+        )
+
+        cache = self._cache
+
+        if cache is None or len(cache[0]) != len(fields) or any(map(operator.is_not, cache[0], fields)):
+            cache = self._cache = (fields, {})
+
+        return cache[1]
+
+
     @classmethod
     def gen_random_id(cls) -> str:
         r = random.randint(0, 2 ** 256)
@@ -96,43 +153,65 @@ class Block:
 
     @classmethod
     def from_dict(cls: type, data: Dict, check: bool=True) -> Block:
-        # verify transactions, but skip reward transaction
-        if data['height'] == 0:
-            transactions = []
-            
-            for tx_data in data['transactions']:
-                tx = Transaction.from_dict(tx_data, check=False)
-                transactions.append(tx)
-        else:
+        b = Block.from_dict_many([data], check=check)[0]
+        return b
+
+
+    @classmethod
+    def from_dict_many(cls: type, data: List[Dict], check: bool=True) -> List[Block]:
+        '''
+        Creates blocks out of dicts. Transactions of all blocks are verified
+        in single batch using `Transaction.verify_many`.
+        '''
+        blocks_transactions = []
+        unverified_transactions = []
+
+        for block_data in data:
             transactions = [
-                Transaction.from_dict(data['transactions'][0], check=False)
+                Transaction.from_dict(tx_data, check=False)
+                for tx_data in block_data['transactions']
             ]
 
-            for tx_data in data['transactions'][1:]:
-                tx = Transaction.from_dict(tx_data, check=True)
-                transactions.append(tx)
-
-        # create block
-        b = Block(
-            version=data['version'],
-            height=data['height'],
-            id_=data['id'],
-            prev_hash=data['prev_hash'],
-            time_=data['time'],
-            transactions=transactions,
-            merkle_root=data['merkle_root'],
-            difficulty=data['difficulty'],
-            nonce=data['nonce'],
-            hash_=data['hash'],
-            check=check,
-        )
+            # verify transactions, but skip reward transaction
+            # genesis block does not have signed transactions
+            if block_data['height'] > 0:
+                unverified_transactions.extend(transactions[1:])
 
-        return b
+            blocks_transactions.append(transactions)
+
+        verified = Transaction.verify_many(unverified_transactions)
+
+        for tx, v in zip(unverified_transactions, verified):
+            if not v:
+                raise TransactionError(f'invalid transaction {tx.id!r}')
+
+        # create blocks
+        blocks = []
+
+        for block_data, transactions in zip(data, blocks_transactions):
+            b = Block(
+                version=block_data['version'],
+                height=block_data['height'],
+                id_=block_data['id'],
+                prev_hash=block_data['prev_hash'],
+                time_=block_data['time'],
+                transactions=transactions,
+                merkle_root=block_data['merkle_root'],
+                difficulty=block_data['difficulty'],
+                nonce=block_data['nonce'],
+                hash_=block_data['hash'],
+                check=check,
+            )
+
+            blocks.append(b)
+
+        return blocks
 
 
     def serialize(self: Block) -> str:
-        data = self.to_dict()
-        message = json.dumps(data)
+        # same as json.dumps(self.to_dict()), derived from hash preimage
+        message = self.get_hash_message()
+        message = f'{message[:-1]}, "hash": {json.dumps(self.hash)}}}'
         return message
 
 
@@ -143,6 +222,36 @@ class Block:
         return b
 
     
+    def serialize_wire(self: Block) -> bytes:
+        '''
+        Serializes into compact binary wire format, see `wire` module.
+        '''
+        data = self.to_dict()
+        message = wire.encode_block(data)
+        return message
+
+
+    @classmethod
+    def deserialize_wire(cls: type, message: bytes, check: bool=True) -> Block:
+        data = wire.decode_block(message)
+        b = Block.from_dict(data, check=check)
+        return b
+
+
+    @classmethod
+    def serialize_wire_many(cls: type, blocks: List[Block]) -> bytes:
+        data = [b.to_dict() for b in blocks]
+        message = wire.encode_blocks(data)
+        return message
+
+
+    @classmethod
+    def deserialize_wire_many(cls: type, message: bytes, check: bool=True) -> List[Block]:
+        data = wire.decode_blocks(message)
+        blocks = Block.from_dict_many(data, check=check)
+        return blocks
+
+
     def verify(self: Block) -> bool:
         if not self.verify_hash():
             return False
@@ -166,144 +275,277 @@ class Block:
 
 
     def verify_nonce(self: Block) -> bool:
-        m = self.to_dict(without=['nonce', 'hash'])
-        m = json.dumps(m)
-        m = m.encode()
+        if not isinstance(self.nonce, int) or not 0 <= self.nonce <= MAX_NONCE:
+            return False
 
-        sha256 = crypto.sha256
-        difficulty = self.difficulty
-        nonce = self.nonce
+        cache = self._get_cache()
 
-        byte_length = int(math.ceil(nonce.bit_length() / 8))
-        n = nonce.to_bytes(byte_length, byteorder='big')
+        try:
+            h = cache['pow_prefix']
+        except KeyError as e:
+            h = cache['pow_prefix'] = crypto.sha256_prefix(self.get_pow_message())
 
-        h = sha256()
-        h.update(m)
-        h.update(n)
-        hd = h.hexdigest()
-        d = int(hd, 16)
+        n = miner.nonce_to_bytes(self.nonce)
+        d = h.intdigest(n)
 
-        if d < difficulty:
+        if d < self.difficulty:
             return True
 
         return False
 
 
-    def calc_merkel_root(self: Block) -> str:
-        m = Merkle()
+    def get_transactions_message(self: Block) -> str:
+        '''
+        Returns transactions as JSON list, same as
+        json.dumps([tx.to_dict() for tx in self.transactions]).
+        '''
+        cache = self._get_cache()
 
-        for tx in self.transactions:
-            try:
-                m.add_leaf(tx.hash)
-            except ValueError as e:
-                raise BlockError(f'wrong transaction hash: {tx.hash!r}')
+        try:
+            return cache['transactions_message']
+        except KeyError as e:
+            pass
 
-        m.make_tree()
-        r = m.get_merkle_root()
-        return r
+        message = '[' + ', '.join(tx.serialize() for tx in self.transactions) + ']'
+        cache['transactions_message'] = message
+        return message
 
 
-    def calc_hash(self: Block) -> str:
-        data = OrderedDict([
+    def get_body_message(self: Block) -> str:
+        '''
+        Returns canonical JSON of block without nonce and hash, and without
+        closing brace. Both proof-of-work and hash preimages are built from it.
+        '''
+        cache = self._get_cache()
+
+        try:
+            return cache['body_message']
+        except KeyError as e:
+            pass
+
+        head = OrderedDict([
             ['version', self.version],
             ['height', self.height],
             ['id', self.id],
             ['prev_hash', self.prev_hash],
             ['time', self.time],
-            ['transactions', [tx.to_dict() for tx in self.transactions]],
+        ])
+
+        tail = OrderedDict([
             ['merkle_root', self.merkle_root],
             ['difficulty', self.difficulty],
-            ['nonce', self.nonce],
-            # without hash
         ])
 
-        message = json.dumps(data)
+        head = codec.dumps_canonical(head)
+        tail = codec.dumps_canonical(tail)
+        transactions = self.get_transactions_message()
+        message = f'{head[:-1]}, "transactions": {transactions}, {tail[1:-1]}'
+        cache['body_message'] = message
+        return message
+
+
+    def get_pow_message(self: Block) -> bytes:
+        '''
+        Returns proof-of-work preimage, nonce bytes are appended to it.
+        Same as json.dumps(self.to_dict(without=['nonce', 'hash'])).encode().
+        '''
+        cache = self._get_cache()
+
+        try:
+            return cache['pow_message']
+        except KeyError as e:
+            pass
+
+        message = (self.get_body_message() + '}').encode()
+        cache['pow_message'] = message
+        return message
+
+
+    def get_hash_message(self: Block) -> str:
+        cache = self._get_cache()
+
+        try:
+            nonce, message = cache['hash_message']
+
+            if nonce is self.nonce:
+                return message
+        except KeyError as e:
+            pass
+
+        body = self.get_body_message()
+        message = f'{body}, "nonce": {codec.dumps_canonical(self.nonce)}}}'
+        cache['hash_message'] = (self.nonce, message)
+        return message
+
+
+    def calc_merkel_root(self: Block) -> str:
+        cache = self._get_cache()
+
+        try:
+            return cache['merkle_root']
+        except KeyError as e:
+            pass
+
+        try:
+            r = merkle_root_hex([tx.hash for tx in self.transactions])
+        except ValueError as e:
+            for tx in self.transactions:
+                try:
+                    bytes.fromhex(tx.hash)
+                except ValueError as e:
+                    raise BlockError(f'wrong transaction hash: {tx.hash!r}')
+
+            raise
+
+        cache['merkle_root'] = r
+        return r
+
+
+    def calc_hash(self: Block) -> str:
+        cache = self._get_cache()
+
+        try:
+            nonce, hash_ = cache['hash']
+
+            if nonce is self.nonce:
+                return hash_
+        except KeyError as e:
+            pass
+
+        message = self.get_hash_message()
         message_bytes = message.encode()
         hash_ = crypto.sha256(message_bytes).hexdigest()
+        cache['hash'] = (self.nonce, hash_)
         return hash_
 
 
-    def calc_nonce(self: Block) -> int:
-        sha256 = crypto.sha256
-        difficulty = self.difficulty
-        
-        m = self.to_dict(without=['nonce', 'hash'])
-        m = json.dumps(m)
-        m = m.encode()
+    def calc_nonce(self: Block, workers: int=0, is_stale: Callable[[], bool]=None) -> int:
+        '''
+        Finds nonce in current process, or if `workers` > 0
+        using that many worker processes.
+        If `is_stale` is given, it is checked between batches of nonces,
+        and once it returns True search is aborted and None is returned.
+        '''
+        if workers == 0 and is_stale is not None:
+            for found, nonce in self.iter_calc_nonce():
+                if found:
+                    return nonce
 
-        found = False
-        nonce = 0
+                if is_stale():
+                    return None
 
-        while not found:
-            byte_length = int(math.ceil(nonce.bit_length() / 8))
-            n = nonce.to_bytes(byte_length, byteorder='big')
+        difficulty = self.difficulty
+        m = self.get_pow_message()
 
-            h = sha256()
-            h.update(m)
-            h.update(n)
-            hd = h.hexdigest()
-            d = int(hd, 16)
+        if workers > 0:
+            return miner.calc_nonce(m, difficulty, workers, is_stale=is_stale)
 
-            if d < difficulty:
-                found = True
-                break
+        search = miner.nonce_search(m, difficulty)
+        nonce = 0
+
+        while True:
+            n = search.search(nonce, 100_000)
 
-            nonce += 1
+            if n is not None:
+                miner.stats.add_nonces(n - nonce + 1)
+                return n
 
-        return nonce
+            miner.stats.add_nonces(100_000)
+            nonce += 100_000
 
 
     def iter_calc_nonce(self: Block, iterations: int=100_000) -> int:
-        sha256 = crypto.sha256
         difficulty = self.difficulty
-        
-        m = self.to_dict(without=['nonce', 'hash'])
-        m = json.dumps(m)
-        m = m.encode()
+        m = self.get_pow_message()
 
+        search = miner.nonce_search(m, difficulty)
         found = False
         nonce = 0
 
         while not found:
-            for i in range(iterations):
-                byte_length = int(math.ceil(nonce.bit_length() / 8))
-                n = nonce.to_bytes(byte_length, byteorder='big')
-
-                h = sha256()
-                h.update(m)
-                h.update(n)
-                hd = h.hexdigest()
-                d = int(hd, 16)
-
-                if d < difficulty:
-                    found = True
-                    break
-                else:
-                    nonce += 1
+            n = search.search(nonce, iterations)
+
+            if n is not None:
+                miner.stats.add_nonces(n - nonce + 1)
+                found = True
+                nonce = n
+            else:
+                miner.stats.add_nonces(iterations)
+                nonce += iterations
 
             yield found, nonce
 
 
-    def mine(self: Block) -> Block:
+    def mine(self: Block, workers: int=0, is_stale: Callable[[], bool]=None) -> Block:
         '''
         Finds nonce, in-place updates block (self), then returns updated object.
         Have in mind that this method mutates block (self).
+        If `workers` > 0, nonce is searched in parallel by worker processes.
+        If `is_stale` returns True during search, mining is aborted,
+        block is left without nonce and hash, and None is returned.
         '''
         if not self.merkle_root:
             self.merkle_root = self.calc_merkel_root()
 
-        nonce = self.calc_nonce()
+        nonce = self.calc_nonce(workers, is_stale)
+
+        if nonce is None:
+            return None
+
         self.nonce = nonce
         self.hash = self.calc_hash()
         return self
 
 
-    def get_transaction(self: Block, transaction_id: str) -> Transaction:
-        for tx in self.transactions:
-            if tx.id == transaction_id:
-                return tx
+    def _get_transactions_index(self: Block) -> Dict[str, int]:
+        '''
+        Returns map of transaction id to its index, built on first lookup.
+        It is rebuilt once `transactions` is reassigned or its length
+        changes, or on lookup which misses or finds transaction with
+        other id (replaced in place). If same id occurs more than once,
+        first one is indexed, same as linear scan did.
+        '''
+        transactions = self.transactions
+        cached = self._transactions_index
 
-        raise ValueError(f'unknown transaction id {transaction_id!r}')
+        if cached is not None and cached[0] is transactions and cached[1] == len(transactions):
+            return cached[2]
+
+        index = {}
+
+        for i, tx in enumerate(transactions):
+            index.setdefault(tx.id, i)
+
+        self._transactions_index = (transactions, len(transactions), index)
+        return index
+
+
+    def get_transaction_index(self: Block, transaction_id: str) -> int:
+        cached = self._transactions_index
+        i = self._get_transactions_index().get(transaction_id)
+
+        # transaction replaced in place, or its id changed,
+        # index which is not just built is rebuilt once
+        if (i is None or self.transactions[i].id != transaction_id) and self._transactions_index is cached:
+            self._transactions_index = None
+            i = self._get_transactions_index().get(transaction_id)
+
+        if i is None:
+            raise ValueError(f'unknown transaction id {transaction_id!r}')
+
+        return i
+
+
+    def has_transaction(self: Block, transaction_id: str) -> bool:
+        try:
+            self.get_transaction_index(transaction_id)
+            return True
+        except ValueError as e:
+            return False
+
+
+    def get_transaction(self: Block, transaction_id: str) -> Transaction:
+        return self.transactions[self.get_transaction_index(transaction_id)]
 
 
 if __name__ == '__main__':
@@ -1,9 +1,13 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple, Optional
 from decimal import Decimal
 from datetime import datetime, timedelta
+from bisect import bisect_left
+from itertools import accumulate
+import heapq
+import base64
 import json
 
-from sqlalchemy import func
+from sqlalchemy import func, case, literal, and_, or_
 from aiohttp import ClientSession
 from dateutil.parser import parse
 from dateutil.relativedelta import relativedelta
@@ -11,8 +15,12 @@ import requests
 
 from .config import Config
 from .db import Session, TransactionModel, BlockModel
+from .db import VolumeHourlyModel, VolumeDailyModel, VolumeMonthlyModel, AddressBalanceModel, RollupStateModel, ChainCounterModel
 from .block import Block
 from .transaction import Transaction
+from .merkle import Merkle
+from . import wire
+from . import codec
 from . import log
 
 
@@ -20,6 +28,104 @@ class BlockchainError(Exception):
     pass
 
 
+def _floor_hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _floor_month(dt: datetime) -> datetime:
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+# range cursors are opaque to clients, they are keys of last row of page,
+# so next page starts right after it instead of skipping rows by offset
+_CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def _encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(codec.dumps(values)).decode()
+
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (AttributeError, TypeError, ValueError) as e:
+        raise BlockchainError('invalid cursor')
+
+    if not isinstance(values, list):
+        raise BlockchainError('invalid cursor')
+
+    return values
+
+
+def _encode_block_cursor(block_row: BlockModel) -> str:
+    return _encode_cursor([block_row.height])
+
+
+def _decode_block_cursor(cursor: str) -> List[int]:
+    values = _decode_cursor(cursor)
+
+    if len(values) != 1 or type(values[0]) is not int:
+        raise BlockchainError('invalid cursor')
+
+    return values
+
+
+def _encode_transaction_cursor(transaction_row: TransactionModel) -> str:
+    return _encode_cursor([transaction_row.time_dt.strftime(_CURSOR_TIME_FORMAT), transaction_row.id])
+
+
+def _decode_transaction_cursor(cursor: str) -> Tuple[datetime, str]:
+    values = _decode_cursor(cursor)
+
+    try:
+        time_dt, id_ = values
+        return datetime.strptime(time_dt, _CURSOR_TIME_FORMAT), str(id_)
+    except (TypeError, ValueError) as e:
+        raise BlockchainError('invalid cursor')
+
+
+def _after_key(columns: list, values: list, is_reversed: bool):
+    # (c0, c1, ...) > (v0, v1, ...), or < if reversed, as nested comparisons,
+    # row values are not supported by every database
+    column, value = columns[-1], values[-1]
+    condition = column < value if is_reversed else column > value
+
+    for column, value in zip(reversed(columns[:-1]), reversed(values[:-1])):
+        condition = or_(
+            column < value if is_reversed else column > value,
+            and_(column == value, condition),
+        )
+
+    # redundant bound on first column, so index range starts at cursor
+    # instead of being scanned from its beginning
+    if len(columns) > 1:
+        condition = and_(columns[0] <= values[0] if is_reversed else columns[0] >= values[0], condition)
+
+    return condition
+
+
+# rollup table, bucket of datetime, bucket length
+VOLUME_ROLLUPS = [
+    [VolumeHourlyModel, _floor_hour, timedelta(hours=1)],
+    [VolumeDailyModel, _floor_day, timedelta(days=1)],
+    [VolumeMonthlyModel, _floor_month, relativedelta(months=1)],
+]
+
+CHAIN_COUNTERS = [
+    'n_blocks',
+    'n_transactions',
+    'n_unconfirmed_transactions',
+    'total_supply_amount',
+]
+
+# amounts and fees are stored as signed 64 bit integers
+MAX_AMOUNT = 2 ** 63 - 1
+
+
 class Blockchain:
     def __init__(self):
         # self.difficulty = 0x000000ffffffffff_ffffffffffffffff_ffffffffffffffff_ffffffffffffffff # NOTE: original difficulty
@@ -29,12 +135,23 @@ class Blockchain:
         self.fee_amount = 1_000
         self.max_supply_amount = 21_000_000 * 1_000_000
 
+        # incremented whenever chain tip or difficulty changes,
+        # miners compare it to detect stale block templates
+        self.generation = 0
+
+
+    def get_generation(self) -> int:
+        return self.generation
+
 
     def get_difficulty(self) -> int:
         return self.difficulty
 
 
     def set_difficulty(self, difficulty: int):
+        if difficulty != self.difficulty:
+            self.generation += 1
+
         self.difficulty = difficulty
 
 
@@ -59,6 +176,15 @@ class Blockchain:
 
 
     def get_total_supply_amount(self, session: Session) -> int:
+        total_supply_amonut = self._get_chain_counter(session, 'total_supply_amount')
+
+        if total_supply_amonut is not None:
+            return total_supply_amonut
+
+        return self._query_total_supply_amount(session)
+
+
+    def _query_total_supply_amount(self, session: Session) -> int:
         q = session.query(func.sum(TransactionModel.amount).label('total_supply_amonut'))
         q = q.filter(TransactionModel.confirmed == True)
         q = q.filter(TransactionModel.sender_address == None)
@@ -67,232 +193,234 @@ class Blockchain:
         return total_supply_amonut
 
 
-    def get_volume(self, session: Session) -> Dict[str, int]:
-        # volume_1h
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(hours=1))
-        r = q.one()
-        volume_1h = r.volume or 0.0
+    def _query_volume_since(self, session: Session, since: List[datetime]) -> List[int]:
+        '''
+        Returns confirmed reward volume since each of given datetimes,
+        from transactions.
 
-        # volume_8h
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(hours=2))
-        r = q.one()
-        volume_8h = r.volume or 0.0
+        All windows are calculated by single query, which buckets
+        transactions by age into disjoint buckets between consecutive
+        datetimes, and windows are cumulative sums of buckets.
+        '''
+        cutoffs = sorted(set(since), reverse=True)
 
-        # volume_12h
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(hours=12))
-        r = q.one()
-        volume_12h = r.volume or 0.0
+        bucket = case(
+            [(TransactionModel.time_dt >= dt, i) for i, dt in enumerate(cutoffs)],
+            else_=None,
+        ).label('bucket')
 
-        # volume_24h
-        # volume_1d
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
+        q = session.query(bucket, func.sum(TransactionModel.amount).label('volume'))
         q = q.filter(TransactionModel.confirmed == True)
         q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(hours=24))
-        r = q.one()
-        volume_24h = r.volume or 0.0
-        volume_1d = volume_24h
+        q = q.filter(TransactionModel.time_dt >= cutoffs[-1])
+        q = q.group_by('bucket')
+        bucket_volume = {r.bucket: r.volume for r in q.all()}
 
-        # volume_2d
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=2))
-        r = q.one()
-        volume_2d = r.volume or 0.
+        volume_since = {}
+        total = 0
 
-        # volume_3d
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=3))
-        r = q.one()
-        volume_3d = r.volume or 0.0
+        for i, dt in enumerate(cutoffs):
+            total += bucket_volume.get(i) or 0
+            volume_since[dt] = total or 0.0
 
-        # volume_5d
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=5))
-        r = q.one()
-        volume_5d = r.volume or 0.0
+        return [volume_since[dt] for dt in since]
 
-        # volume_7d
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=7))
-        r = q.one()
-        volume_7d = r.volume or 0.0
 
-        # volume_10d
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=10))
-        r = q.one()
-        volume_10d = r.volume or 0.0
+    def _get_volume_since(self, session: Session, since: List[datetime]) -> List[int]:
+        '''
+        Returns confirmed reward volume since each of given datetimes,
+        from rollup tables if they are built, otherwise from transactions.
 
-        # volume_15d
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=15))
-        r = q.one()
-        volume_15d = r.volume or 0.0
+        Window is split into whole months, days and hours, read from
+        rollups, and remaining part of first hour, read from transactions:
+            [dt, hour) [hour, day) [day, month) [month, ...)
+        '''
+        if not self.has_rollup(session, 'volume'):
+            return self._query_volume_since(session, since)
 
-        # volume_30d
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=30))
-        r = q.one()
-        volume_30d = r.volume or 0.0
+        cutoffs = sorted(set(since))
 
-        # volume_1m
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - relativedelta(months=1))
-        r = q.one()
-        volume_1m = r.volume or 0.0
+        # boundaries of window parts, per cutoff
+        bounds = []
 
-        # volume_2m
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - relativedelta(months=2))
-        r = q.one()
-        volume_2m = r.volume or 0.0
+        for dt in cutoffs:
+            b = [dt]
 
-        # volume_3m
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - relativedelta(months=3))
-        r = q.one()
-        volume_3m = r.volume or 0.0
+            for model, floor, step in VOLUME_ROLLUPS:
+                f = floor(b[-1])
+                b.append(f if f == b[-1] else f + step)
 
-        # volume_6m
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - relativedelta(months=6))
-        r = q.one()
-        volume_6m = r.volume or 0.0
+            bounds.append(b)
 
-        # volume_12m
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - relativedelta(months=12))
-        r = q.one()
-        volume_12m = r.volume or 0.0
-        volume_1y = volume_12m
+        # remaining parts of first hours, each one is indexed range scan
+        queries = []
 
-        # volume_2y
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - relativedelta(months=2 * 12))
-        r = q.one()
-        volume_2y = r.volume or 0.0
+        for i, b in enumerate(bounds):
+            if b[0] == b[1]:
+                continue
 
-        # volume_3y
-        q = session.query(func.sum(TransactionModel.amount).label('volume'))
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == None)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - relativedelta(months=3 * 12))
-        r = q.one()
-        volume_3y = r.volume or 0.0
-
-        # volume
-        volume = {
-            '1h': volume_1h,
-            '8h': volume_8h,
-            '12h': volume_12h,
-            '24h': volume_24h,
-            '1d': volume_1d,
-            '2d': volume_2d,
-            '3d': volume_3d,
-            '5d': volume_5d,
-            '7d': volume_7d,
-            '10d': volume_10d,
-            '15d': volume_15d,
-            '30d': volume_30d,
-            '1m': volume_1m,
-            '2m': volume_2m,
-            '3m': volume_3m,
-            '6m': volume_6m,
-            '12m': volume_12m,
-            '1y': volume_1y,
-            '2y': volume_2y,
-            '3y': volume_3y,
-        }
+            q = session.query(literal(i).label('i'), func.sum(TransactionModel.amount).label('volume'))
+            q = q.filter(TransactionModel.confirmed == True)
+            q = q.filter(TransactionModel.sender_address == None)
+            q = q.filter(TransactionModel.time_dt >= b[0])
+            q = q.filter(TransactionModel.time_dt < b[1])
+            queries.append(q)
 
-        return volume
+        volume_since = {dt: 0 for dt in cutoffs}
 
+        if queries:
+            for r in queries[0].union_all(*queries[1:]):
+                volume_since[cutoffs[r.i]] += r.volume or 0
 
-    def get_hourly_volume(self, session: Session) -> int:
-        volume = []
+        # whole hours, days, months
+        for i, (model, floor, step) in enumerate(VOLUME_ROLLUPS):
+            q = session.query(model.bucket, model.volume)
 
-        for i in range(23, -1, -1):
-            dt = datetime.utcnow() - timedelta(hours=i)
+            if i + 1 < len(VOLUME_ROLLUPS):
+                q = q.filter(or_(*[and_(model.bucket >= b[i + 1], model.bucket < b[i + 2]) for b in bounds]))
+            else:
+                q = q.filter(model.bucket >= min(b[i + 1] for b in bounds))
 
-            q = session.query(func.sum(TransactionModel.amount).label('volume'))
-            q = q.filter(TransactionModel.confirmed == True)
-            q = q.filter(TransactionModel.sender_address == None)
-            q = q.filter(TransactionModel.time_dt >= dt)
-            r = q.one()
-            v = r.volume or 0.0
+            rows = sorted(q.all())
+            buckets = [r.bucket for r in rows]
+            cumulative_volume = [0] + list(accumulate(r.volume for r in rows))
 
-            volume.append([dt.isoformat(), v])
+            for dt, b in zip(cutoffs, bounds):
+                start = bisect_left(buckets, b[i + 1])
+                end = bisect_left(buckets, b[i + 2]) if i + 1 < len(VOLUME_ROLLUPS) else len(buckets)
+                volume_since[dt] += cumulative_volume[end] - cumulative_volume[start]
 
-        return volume
+        return [volume_since[dt] or 0.0 for dt in since]
 
 
-    def get_daily_volume(self, session: Session) -> int:
-        volume = []
+    def has_rollup(self, session: Session, name: str) -> bool:
+        q = session.query(RollupStateModel)
+        q = q.filter(RollupStateModel.name == name)
+        return q.first() is not None
 
-        for i in range(31, -1, -1):
-            dt = datetime.utcnow() - timedelta(days=i)
 
-            q = session.query(func.sum(TransactionModel.amount).label('volume'))
-            q = q.filter(TransactionModel.confirmed == True)
-            q = q.filter(TransactionModel.sender_address == None)
-            q = q.filter(TransactionModel.time_dt >= dt)
-            r = q.one()
-            v = r.volume or 0.0
+    def _set_rollup(self, session: Session, name: str):
+        if not self.has_rollup(session, name):
+            session.add(RollupStateModel(name=name))
+
+
+    def _get_volume_by_bucket(self, volume_by_time: List[Tuple[datetime, int]]) -> List[Dict[datetime, int]]:
+        volume_by_bucket = [{} for rollup in VOLUME_ROLLUPS]
+
+        for dt, amount in volume_by_time:
+            for (model, floor, step), v in zip(VOLUME_ROLLUPS, volume_by_bucket):
+                bucket = floor(dt)
+                v[bucket] = v.get(bucket, 0) + amount
+
+        return volume_by_bucket
+
+
+    def _add_volume_rollups(self, session: Session, volume_by_time: List[Tuple[datetime, int]]):
+        volume_by_bucket = self._get_volume_by_bucket(volume_by_time)
+
+        for (model, floor, step), v in zip(VOLUME_ROLLUPS, volume_by_bucket):
+            for bucket, volume in v.items():
+                row = session.query(model).get(bucket)
+
+                if row is None:
+                    session.add(model(bucket=bucket, volume=volume))
+                else:
+                    row.volume = row.volume + volume
+
+
+    def rebuild_volume_rollups(self, session: Session):
+        '''
+        Builds volume rollup tables from all confirmed transactions,
+        needed once for databases created before rollups.
+        '''
+        for model, floor, step in VOLUME_ROLLUPS:
+            session.query(model).delete()
+
+        q = session.query(TransactionModel.time_dt, TransactionModel.amount)
+        q = q.filter(TransactionModel.confirmed == True)
+        q = q.filter(TransactionModel.sender_address == None)
+        q = q.yield_per(10_000)
+        volume_by_bucket = self._get_volume_by_bucket((r.time_dt, r.amount) for r in q)
+
+        for (model, floor, step), v in zip(VOLUME_ROLLUPS, volume_by_bucket):
+            session.add_all([model(bucket=bucket, volume=volume) for bucket, volume in v.items()])
+
+        self._set_rollup(session, 'volume')
+        session.flush()
+
+
+    def check_volume_rollups(self, session: Session) -> bool:
+        '''
+        Compares volumes from rollup tables to volumes from transactions.
+        '''
+        now = datetime.utcnow()
+        since = [dt for k, dt in self._get_volume_windows(now)]
+        since += [now - timedelta(hours=i) for i in range(24)]
+        since += [now - timedelta(days=i) for i in range(32)]
+        since += [now - relativedelta(months=i) for i in range(36)]
+        rollup_volume = self._get_volume_since(session, since)
+        volume = self._query_volume_since(session, since)
+
+        for dt, a, b in zip(since, rollup_volume, volume):
+            if a != b:
+                log.error(f'volume since {dt.isoformat()} from rollups {a!r} differs from {b!r}')
+                return False
+
+        return True
+
+
+    def _get_volume_windows(self, now: datetime) -> List[Tuple[str, datetime]]:
+        windows = [
+            ['1h', now - timedelta(hours=1)],
+            ['8h', now - timedelta(hours=8)],
+            ['12h', now - timedelta(hours=12)],
+            ['24h', now - timedelta(hours=24)],
+            ['1d', now - timedelta(hours=24)],
+            ['2d', now - timedelta(days=2)],
+            ['3d', now - timedelta(days=3)],
+            ['5d', now - timedelta(days=5)],
+            ['7d', now - timedelta(days=7)],
+            ['10d', now - timedelta(days=10)],
+            ['15d', now - timedelta(days=15)],
+            ['30d', now - timedelta(days=30)],
+            ['1m', now - relativedelta(months=1)],
+            ['2m', now - relativedelta(months=2)],
+            ['3m', now - relativedelta(months=3)],
+            ['6m', now - relativedelta(months=6)],
+            ['12m', now - relativedelta(months=12)],
+            ['1y', now - relativedelta(months=12)],
+            ['2y', now - relativedelta(months=2 * 12)],
+            ['3y', now - relativedelta(months=3 * 12)],
+        ]
 
-            volume.append([dt.isoformat(), v])
+        return windows
 
+
+    def get_volume(self, session: Session) -> Dict[str, int]:
+        windows = self._get_volume_windows(datetime.utcnow())
+        volume_since = self._get_volume_since(session, [dt for k, dt in windows])
+        volume = {k: v for (k, dt), v in zip(windows, volume_since)}
         return volume
 
 
-    def get_monthly_volume(self, session: Session) -> int:
-        volume = []
+    def get_hourly_volume(self, session: Session) -> int:
+        now = datetime.utcnow()
+        dts = [now - timedelta(hours=i) for i in range(23, -1, -1)]
+        volume = [[dt.isoformat(), v] for dt, v in zip(dts, self._get_volume_since(session, dts))]
+        return volume
 
-        for i in range(35, -1, -1):
-            dt = datetime.utcnow() - relativedelta(months=i)
 
-            q = session.query(func.sum(TransactionModel.amount).label('volume'))
-            q = q.filter(TransactionModel.confirmed == True)
-            q = q.filter(TransactionModel.sender_address == None)
-            q = q.filter(TransactionModel.time_dt >= dt)
-            r = q.one()
-            v = r.volume or 0.0
+    def get_daily_volume(self, session: Session) -> int:
+        now = datetime.utcnow()
+        dts = [now - timedelta(days=i) for i in range(31, -1, -1)]
+        volume = [[dt.isoformat(), v] for dt, v in zip(dts, self._get_volume_since(session, dts))]
+        return volume
 
-            volume.append([dt.isoformat(), v])
 
+    def get_monthly_volume(self, session: Session) -> int:
+        now = datetime.utcnow()
+        dts = [now - relativedelta(months=i) for i in range(35, -1, -1)]
+        volume = [[dt.isoformat(), v] for dt, v in zip(dts, self._get_volume_since(session, dts))]
         return volume
 
 
@@ -316,117 +444,142 @@ class Blockchain:
         return True
 
 
-    def get_address_info(self, session: Session, address: str, check: bool = True,
-                         return_confirmed_transactions: bool = True,
-                         return_unconfirmed_transactions: bool = True) -> Dict[str, int]:
-        confirmed_transactions = []
-        unconfirmed_transactions = []
-        
-        confirmed_total_received = 0
-        confirmed_total_sent = 0
-        confirmed_total_fee = 0
-        confirmed_balance = 0
+    def _filter_address_transactions(self, q, confirmed: bool):
+        q = q.filter(TransactionModel.confirmed == confirmed)
 
-        unconfirmed_total_received = 0
-        unconfirmed_total_sent = 0
-        unconfirmed_total_fee = 0
-        unconfirmed_balance = 0
+        if not confirmed:
+            q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=1))
+            q = q.filter(TransactionModel.amount >= 0)
+            q = q.filter(TransactionModel.fee >= 0)
 
-        # confirmed transaction sender_address
-        q = session.query(TransactionModel)
-        q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == address)
-        transactions_rows = q.all()
+        return q
 
-        for tx_row in transactions_rows:
-            tx = Transaction(
-                version=tx_row.version,
-                id_=tx_row.id,
-                time_=tx_row.time,
-                sender_address=tx_row.sender_address,
-                recipient_address=tx_row.recipient_address,
-                sender_public_key=tx_row.sender_public_key,
-                amount=tx_row.amount,
-                fee=tx_row.fee,
-                signature=tx_row.signature,
-                hash_=tx_row.hash,
-                check=True if check and tx_row.sender_address else False,
-            )
 
-            confirmed_total_sent += tx.amount
-            confirmed_total_fee += tx.fee
+    def _get_address_totals(self, session: Session, address: str, confirmed: bool) -> Tuple[int, int, int]:
+        '''
+        Returns total received, sent and fee of confirmed or unconfirmed
+        transactions of address.
+        '''
+        # optimized call
+        if confirmed and self.has_rollup(session, 'address_balance'):
+            q = session.query(AddressBalanceModel)
+            q = q.filter(AddressBalanceModel.address == address)
+            r = q.first()
 
-            if return_confirmed_transactions:
-                confirmed_transactions.append(tx)
+            if r is None:
+                return 0, 0, 0
 
-        # confirmed transaction recipient_address
-        q = session.query(TransactionModel)
-        q = q.filter(TransactionModel.confirmed == True)
+            return r.total_received, r.total_sent, r.total_fee
+
+        # total_sent, total_fee
+        q = session.query(
+            func.sum(TransactionModel.amount).label('total_sent'),
+            func.sum(TransactionModel.fee).label('total_fee'),
+        )
+
+        q = self._filter_address_transactions(q, confirmed)
+        q = q.filter(TransactionModel.sender_address == address)
+        r = q.one()
+        total_sent = r.total_sent or 0
+        total_fee = r.total_fee or 0
+
+        # total_received
+        q = session.query(func.sum(TransactionModel.amount).label('total_received'))
+        q = self._filter_address_transactions(q, confirmed)
         q = q.filter(TransactionModel.recipient_address == address)
-        transactions_rows = q.all()
+        r = q.one()
+        total_received = r.total_received or 0
+
+        return total_received, total_sent, total_fee
+
+
+    def _get_address_n_transactions(self, session: Session, address: str, confirmed: bool) -> int:
+        '''
+        Returns number of confirmed or unconfirmed transactions of address,
+        transaction to itself is counted once.
+        '''
+        q = session.query(func.count(TransactionModel.id))
+        q = self._filter_address_transactions(q, confirmed)
+        q = q.filter(or_(TransactionModel.sender_address == address, TransactionModel.recipient_address == address))
+        return q.scalar() or 0
+
+
+    def _get_address_transaction_rows(self, session: Session, address: str, confirmed: bool,
+                                      after: Optional[Tuple[datetime, str]] = None,
+                                      limit: Optional[int] = None) -> List[TransactionModel]:
+        '''
+        Returns at most limit transaction rows of address ordered by time
+        and id, after given (time_dt, id) key. Sent and received rows are
+        read by two queries in index order, each limited, and merged.
+        '''
+        # NOTE: each query is read whole before next one is executed,
+        #       streamed results of both would be open at once on same
+        #       connection, which MySQL does not support
+        branches = []
+
+        for column in (TransactionModel.sender_address, TransactionModel.recipient_address):
+            q = session.query(TransactionModel)
+            q = self._filter_address_transactions(q, confirmed)
+            q = q.filter(column == address)
+
+            if after is not None:
+                time_dt, id_ = after
+                q = q.filter(or_(
+                    TransactionModel.time_dt > time_dt,
+                    and_(TransactionModel.time_dt == time_dt, TransactionModel.id > id_),
+                ))
+
+            q = q.order_by(TransactionModel.time_dt, TransactionModel.id)
+
+            if limit is not None:
+                q = q.limit(limit)
+
+            branches.append(q.all())
+
+        transactions_rows = []
+
+        for tx_row in heapq.merge(*branches, key=lambda r: (r.time_dt, r.id)):
+            # transaction to itself is both sent and received
+            if transactions_rows and transactions_rows[-1].id == tx_row.id:
+                continue
 
-        for tx_row in transactions_rows:
-            tx = Transaction(
-                version=tx_row.version,
-                id_=tx_row.id,
-                time_=tx_row.time,
-                sender_address=tx_row.sender_address,
-                recipient_address=tx_row.recipient_address,
-                sender_public_key=tx_row.sender_public_key,
-                amount=tx_row.amount,
-                fee=tx_row.fee,
-                signature=tx_row.signature,
-                hash_=tx_row.hash,
-                check=True if check and tx_row.sender_address else False,
-            )
+            if limit is not None and len(transactions_rows) == limit:
+                break
 
-            confirmed_total_received += tx.amount
+            transactions_rows.append(tx_row)
 
-            if return_confirmed_transactions:
-                confirmed_transactions.append(tx)
+        return transactions_rows
 
-        confirmed_balance = confirmed_total_received - confirmed_total_sent - confirmed_total_fee
 
-        # unconfirmed transaction sender_address
-        q = session.query(TransactionModel)
-        q = q.filter(TransactionModel.confirmed == False)
-        q = q.filter(TransactionModel.sender_address == address)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=1))
-        q = q.filter(TransactionModel.amount >= 0)
-        q = q.filter(TransactionModel.fee >= 0)
-        transactions_rows = q.all()
+    def get_address_transactions(self, session: Session, address: str, confirmed: bool = True,
+                                 cursor: Optional[str] = None, limit: Optional[int] = None,
+                                 check: bool = True) -> Tuple[List[Transaction], Optional[str]]:
+        '''
+        Returns page of confirmed or unconfirmed transactions of address,
+        oldest first, and cursor of next page, or None if there are no
+        more transactions. Cursor is id of last transaction of page.
+        '''
+        after = None
 
-        for tx_row in transactions_rows:
-            tx = Transaction(
-                version=tx_row.version,
-                id_=tx_row.id,
-                time_=tx_row.time,
-                sender_address=tx_row.sender_address,
-                recipient_address=tx_row.recipient_address,
-                sender_public_key=tx_row.sender_public_key,
-                amount=tx_row.amount,
-                fee=tx_row.fee,
-                signature=tx_row.signature,
-                hash_=tx_row.hash,
-                check=True if check and tx_row.sender_address else False,
-            )
+        if cursor is not None:
+            q = session.query(TransactionModel.time_dt, TransactionModel.id)
+            q = q.filter(TransactionModel.id == cursor)
+            r = q.first()
 
-            unconfirmed_total_sent += tx.amount
-            unconfirmed_total_fee += tx.fee
+            if r is None:
+                raise BlockchainError('invalid cursor')
 
-            if return_unconfirmed_transactions:
-                unconfirmed_transactions.append(tx)
+            after = (r.time_dt, r.id)
 
-        # unconfirmed transaction recipient_address
-        q = session.query(TransactionModel)
-        q = q.filter(TransactionModel.confirmed == False)
-        q = q.filter(TransactionModel.recipient_address == address)
-        q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=1))
-        q = q.filter(TransactionModel.amount >= 0)
-        q = q.filter(TransactionModel.fee >= 0)
-        transactions_rows = q.all()
+        transactions = []
+        next_cursor = None
+        transactions_rows = self._get_address_transaction_rows(session, address, confirmed, after, None if limit is None else limit + 1)
 
         for tx_row in transactions_rows:
+            if limit is not None and len(transactions) == limit:
+                next_cursor = transactions[-1].id
+                break
+
             tx = Transaction(
                 version=tx_row.version,
                 id_=tx_row.id,
@@ -441,13 +594,44 @@ class Blockchain:
                 check=True if check and tx_row.sender_address else False,
             )
 
-            unconfirmed_total_received += tx.amount
+            transactions.append(tx)
+
+        return transactions, next_cursor
+
+
+    def get_address_info(self, session: Session, address: str, check: bool = True,
+                         return_confirmed_transactions: bool = True,
+                         return_unconfirmed_transactions: bool = True,
+                         limit: Optional[int] = None,
+                         confirmed_cursor: Optional[str] = None,
+                         unconfirmed_cursor: Optional[str] = None) -> Dict[str, int]:
+        '''
+        Returns totals of address, and pages of its confirmed and
+        unconfirmed transactions, see `get_address_transactions`.
+        Totals and numbers of transactions always cover all transactions.
+        '''
+        confirmed_transactions = []
+        unconfirmed_transactions = []
+        next_confirmed_cursor = None
+        next_unconfirmed_cursor = None
+
+        if return_confirmed_transactions:
+            confirmed_transactions, next_confirmed_cursor = self.get_address_transactions(
+                session, address, True, confirmed_cursor, limit, check)
+
+        if return_unconfirmed_transactions:
+            unconfirmed_transactions, next_unconfirmed_cursor = self.get_address_transactions(
+                session, address, False, unconfirmed_cursor, limit, check)
 
-            if return_unconfirmed_transactions:
-                unconfirmed_transactions.append(tx)
+        confirmed_total_received, confirmed_total_sent, confirmed_total_fee = self._get_address_totals(session, address, True)
+        confirmed_balance = confirmed_total_received - confirmed_total_sent - confirmed_total_fee
 
+        unconfirmed_total_received, unconfirmed_total_sent, unconfirmed_total_fee = self._get_address_totals(session, address, False)
         unconfirmed_balance = unconfirmed_total_received - unconfirmed_total_sent - unconfirmed_total_fee
 
+        n_confirmed_transactions = self._get_address_n_transactions(session, address, True)
+        n_unconfirmed_transactions = self._get_address_n_transactions(session, address, False)
+
         # total
         total_received = confirmed_total_received + unconfirmed_total_received
         total_sent = confirmed_total_sent + unconfirmed_total_sent
@@ -458,6 +642,10 @@ class Blockchain:
             'address': address,
             'confirmed_transactions': confirmed_transactions,
             'unconfirmed_transactions': unconfirmed_transactions,
+            'next_confirmed_cursor': next_confirmed_cursor,
+            'next_unconfirmed_cursor': next_unconfirmed_cursor,
+            'n_confirmed_transactions': n_confirmed_transactions,
+            'n_unconfirmed_transactions': n_unconfirmed_transactions,
             
             'confirmed_total_received': confirmed_total_received,
             'confirmed_total_sent': confirmed_total_sent,
@@ -475,36 +663,184 @@ class Blockchain:
 
 
     def _get_address_info_confirmed_balance(self, session: Session, address: str) -> int:
-        # optimized call
-        confirmed_total_received = 0
-        confirmed_total_sent = 0
-        confirmed_total_fee = 0
-        confirmed_balance = 0
+        confirmed_total_received, confirmed_total_sent, confirmed_total_fee = self._get_address_totals(session, address, True)
+        return confirmed_total_received - confirmed_total_sent - confirmed_total_fee
+
+
+    def _get_address_balances(self, transfers: List[Tuple[str, str, int, int]]) -> Dict[str, List[int]]:
+        # address: [total_received, total_sent, total_fee]
+        address_balances = {}
+
+        for sender_address, recipient_address, amount, fee in transfers:
+            if recipient_address is not None:
+                address_balances.setdefault(recipient_address, [0, 0, 0])[0] += amount
+
+            if sender_address is not None:
+                b = address_balances.setdefault(sender_address, [0, 0, 0])
+                b[1] += amount
+                b[2] += fee
+
+        return address_balances
+
+
+    def _add_address_balances(self, session: Session, transfers: List[Tuple[str, str, int, int]]):
+        address_balances = self._get_address_balances(transfers)
+        addresses = list(address_balances)
+        rows = {}
+
+        for i in range(0, len(addresses), 500):
+            q = session.query(AddressBalanceModel)
+            q = q.filter(AddressBalanceModel.address.in_(addresses[i:i + 500]))
+            rows.update({row.address: row for row in q})
+
+        for address, (total_received, total_sent, total_fee) in address_balances.items():
+            row = rows.get(address)
+
+            if row is None:
+                row = AddressBalanceModel(address=address, total_received=0, total_sent=0, total_fee=0, balance=0)
+                session.add(row)
+
+            row.total_received = row.total_received + total_received
+            row.total_sent = row.total_sent + total_sent
+            row.total_fee = row.total_fee + total_fee
+            row.balance = row.total_received - row.total_sent - row.total_fee
+
+
+    def rebuild_address_balances(self, session: Session):
+        '''
+        Builds address balance table from all confirmed transactions,
+        needed once for databases created before it.
+        '''
+        session.query(AddressBalanceModel).delete()
+
+        q = session.query(
+            TransactionModel.sender_address,
+            TransactionModel.recipient_address,
+            TransactionModel.amount,
+            TransactionModel.fee,
+        )
 
-        # confirmed_total_sent
-        q = session.query(func.sum(TransactionModel.amount).label('confirmed_total_sent'))
         q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == address)
-        r = q.one()
-        confirmed_total_sent = r.confirmed_total_sent or 0.0
+        q = q.yield_per(10_000)
+        address_balances = self._get_address_balances(q)
+
+        session.add_all([
+            AddressBalanceModel(
+                address=address,
+                total_received=total_received,
+                total_sent=total_sent,
+                total_fee=total_fee,
+                balance=total_received - total_sent - total_fee,
+            )
+            for address, (total_received, total_sent, total_fee) in address_balances.items()
+        ])
 
-        # confirmed_total_fee
-        q = session.query(func.sum(TransactionModel.fee).label('confirmed_total_fee'))
+        self._set_rollup(session, 'address_balance')
+        session.flush()
+
+
+    def check_address_balances(self, session: Session) -> bool:
+        '''
+        Compares address balance table to sums of confirmed transactions.
+        '''
+        address_balances = {}
+
+        q = session.query(TransactionModel.recipient_address, func.sum(TransactionModel.amount))
         q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.sender_address == address)
-        r = q.one()
-        confirmed_total_fee = r.confirmed_total_fee or 0.0
+        q = q.filter(TransactionModel.recipient_address != None)
+        q = q.group_by(TransactionModel.recipient_address)
 
-        # confirmed_total_received
-        q = session.query(func.sum(TransactionModel.amount).label('confirmed_total_received'))
+        for address, total_received in q:
+            address_balances.setdefault(address, [0, 0, 0])[0] = total_received
+
+        q = session.query(TransactionModel.sender_address, func.sum(TransactionModel.amount), func.sum(TransactionModel.fee))
         q = q.filter(TransactionModel.confirmed == True)
-        q = q.filter(TransactionModel.recipient_address == address)
-        r = q.one()
-        confirmed_total_received = r.confirmed_total_received or 0.0
+        q = q.filter(TransactionModel.sender_address != None)
+        q = q.group_by(TransactionModel.sender_address)
 
-        # confirmed_balance
-        confirmed_balance = confirmed_total_received - confirmed_total_sent - confirmed_total_fee
-        return confirmed_balance
+        for address, total_sent, total_fee in q:
+            b = address_balances.setdefault(address, [0, 0, 0])
+            b[1] = total_sent
+            b[2] = total_fee
+
+        rows = {row.address: row for row in session.query(AddressBalanceModel)}
+
+        if set(rows) != set(address_balances):
+            log.error('addresses in address balances differ from addresses of transactions')
+            return False
+
+        for address, (total_received, total_sent, total_fee) in address_balances.items():
+            row = rows[address]
+            balance = total_received - total_sent - total_fee
+
+            if [row.total_received, row.total_sent, row.total_fee, row.balance] != [total_received, total_sent, total_fee, balance]:
+                log.error(f'address balance of {address!r} differs from transactions')
+                return False
+
+        return True
+
+
+    #
+    # chain counters
+    #
+    def _get_chain_counter(self, session: Session, name: str) -> Optional[int]:
+        # None if counters are not built, and must be counted from tables
+        if not self.has_rollup(session, 'chain_counters'):
+            return None
+
+        row = session.query(ChainCounterModel).get(name)
+        return row.value if row else 0
+
+
+    def _add_chain_counters(self, session: Session, counters: Dict[str, int]):
+        for name, n in counters.items():
+            if n == 0:
+                continue
+
+            row = session.query(ChainCounterModel).get(name)
+
+            if row is None:
+                session.add(ChainCounterModel(name=name, value=n))
+            else:
+                row.value = row.value + n
+
+
+    def _query_chain_counters(self, session: Session) -> Dict[str, int]:
+        return {
+            'n_blocks': self._query_n_blocks(session),
+            'n_transactions': self._query_n_transactions(session),
+            'n_unconfirmed_transactions': self._query_n_unconfirmed_transactions(session),
+            'total_supply_amount': int(self._query_total_supply_amount(session)),
+        }
+
+
+    def rebuild_chain_counters(self, session: Session):
+        '''
+        Builds chain counters by counting blocks and transactions,
+        needed once for databases created before counters.
+        '''
+        session.query(ChainCounterModel).delete()
+        counters = self._query_chain_counters(session)
+        session.add_all([ChainCounterModel(name=name, value=n) for name, n in counters.items()])
+        self._set_rollup(session, 'chain_counters')
+        session.flush()
+
+
+    def check_chain_counters(self, session: Session) -> bool:
+        '''
+        Compares chain counters to counts of blocks and transactions.
+        '''
+        counters = self._query_chain_counters(session)
+        is_valid = True
+
+        for name in CHAIN_COUNTERS:
+            n = self._get_chain_counter(session, name)
+
+            if n != counters[name]:
+                log.error(f'chain counter {name!r} is {n}, but counted {counters[name]}')
+                is_valid = False
+
+        return is_valid
 
 
     #
@@ -530,7 +866,13 @@ class Blockchain:
         return tx
 
 
-    def get_transactions_range(self, session: Session, start: int, end: int=None, is_reversed: bool=False) -> List[Transaction]:
+    def get_transactions_range(self, session: Session, start: int, end: int=None, is_reversed: bool=False,
+                               cursor: Optional[str]=None) -> Tuple[List[Transaction], Optional[str]]:
+        '''
+        Returns confirmed transactions ordered by time and id, and cursor
+        of next page, or None if it is last page. If cursor is given,
+        start and end count from transaction right after cursor.
+        '''
         if end is None:
             end = start + 15_000
 
@@ -540,13 +882,22 @@ class Blockchain:
         assert start < end
         assert end - start <= 15_000
 
+        keys = [TransactionModel.time_dt, TransactionModel.id]
         q = session.query(TransactionModel)
         q = q.filter(TransactionModel.confirmed == True)
-        q = q.order_by(TransactionModel.time_dt.desc() if is_reversed else TransactionModel.time_dt.asc())
+
+        if cursor is not None:
+            q = q.filter(_after_key(keys, _decode_transaction_cursor(cursor), is_reversed))
+
+        q = q.order_by(*[k.desc() if is_reversed else k.asc() for k in keys])
         q = q.offset(start)
         q = q.limit(end - start)
         transactions_rows = q.all()
         transactions = []
+        next_cursor = None
+
+        if len(transactions_rows) == end - start:
+            next_cursor = _encode_transaction_cursor(transactions_rows[-1])
 
         for transaction_row in transactions_rows:
             tx = Transaction(
@@ -565,16 +916,99 @@ class Blockchain:
 
             transactions.append(tx)
 
-        return transactions
+        return transactions, next_cursor
 
 
     def get_n_transactions(self, session: Session) -> int:
+        n = self._get_chain_counter(session, 'n_transactions')
+
+        if n is not None:
+            return n
+
+        return self._query_n_transactions(session)
+
+
+    def _query_n_transactions(self, session: Session) -> int:
         q = session.query(TransactionModel)
         q = q.filter(TransactionModel.confirmed == True)
         n = q.count()
         return n
 
 
+    def get_transaction_proof(self, session: Session, transaction_id: str) -> Dict:
+        '''
+        Returns merkle audit path of confirmed transaction within its block.
+        '''
+        q = session.query(TransactionModel.id, TransactionModel.block_id, TransactionModel.hash)
+        q = q.filter(TransactionModel.confirmed == True)
+        q = q.filter(TransactionModel.id == transaction_id)
+        tx_row = q.first()
+
+        if not tx_row:
+            raise BlockchainError('unknown transaction')
+
+        # NOTE: transactions confirmed while unconfirmed used to be stored
+        #       without block id, migration of v1 tables sets it
+        if tx_row.block_id is None:
+            raise BlockchainError('unknown block of transaction')
+
+        q = session.query(BlockModel)
+        q = q.filter(BlockModel.id == tx_row.block_id)
+        block_row = q.first()
+
+        if not block_row:
+            raise BlockchainError('block of transaction does not exist')
+
+        # transactions are not verified, proof is checked against merkle root
+        transactions = [Transaction.from_dict(tx, check=False) for tx in json.loads(block_row.transactions)]
+
+        block = Block(
+            version=block_row.version,
+            height=block_row.height,
+            id_=block_row.id,
+            prev_hash=block_row.prev_hash,
+            time_=block_row.time,
+            transactions=transactions,
+            merkle_root=block_row.merkle_root,
+            difficulty=block_row.difficulty,
+            nonce=block_row.nonce,
+            hash_=block_row.hash,
+            check=False,
+        )
+
+        try:
+            index = block.get_transaction_index(tx_row.id)
+        except ValueError as e:
+            raise BlockchainError('transaction is not in block')
+
+        tx_hashes = [tx.hash for tx in block.transactions]
+
+        m = Merkle()
+
+        try:
+            m.add_leaf(tx_hashes)
+            m.make_tree()
+            path = m.get_proof(index)
+        except ValueError as e:
+            raise BlockchainError('wrong transaction hash in block')
+
+        if m.get_merkle_root() != block_row.merkle_root:
+            raise BlockchainError('wrong merkle root of block')
+
+        proof = {
+            'transaction_id': tx_row.id,
+            'transaction_hash': tx_hashes[index],
+            'block_id': block_row.id,
+            'block_height': block_row.height,
+            'block_hash': block_row.hash,
+            'merkle_root': block_row.merkle_root,
+            'index': index,
+            'proof': path,
+        }
+
+        return proof
+
+
     #
     # unconfirmed transactions
     #
@@ -601,7 +1035,11 @@ class Blockchain:
         return tx
 
 
-    def get_unconfirmed_transactions_range(self, session: Session, start: int, end: int=None, is_reversed: bool=False) -> List[Transaction]:
+    def get_unconfirmed_transactions_range(self, session: Session, start: int, end: int=None, is_reversed: bool=False,
+                                           cursor: Optional[str]=None) -> Tuple[List[Transaction], Optional[str]]:
+        '''
+        Same as `get_transactions_range`, for unconfirmed transactions.
+        '''
         if end is None:
             end = start + 10_000
 
@@ -611,9 +1049,14 @@ class Blockchain:
         assert start < end
         assert end - start <= 10_000
 
+        keys = [TransactionModel.time_dt, TransactionModel.id]
         q = session.query(TransactionModel)
         q = q.filter(TransactionModel.confirmed == False)
-        q = q.order_by(TransactionModel.time_dt.desc() if is_reversed else TransactionModel.time_dt.asc())
+
+        if cursor is not None:
+            q = q.filter(_after_key(keys, _decode_transaction_cursor(cursor), is_reversed))
+
+        q = q.order_by(*[k.desc() if is_reversed else k.asc() for k in keys])
         # q = q.filter(TransactionModel.time_dt >= datetime.utcnow() - timedelta(days=1))
         q = q.filter(TransactionModel.amount >= 0)
         q = q.filter(TransactionModel.fee >= 0)
@@ -621,6 +1064,11 @@ class Blockchain:
         q = q.limit(end - start)
         transactions_rows = q.all()
         transactions = []
+        next_cursor = None
+
+        # bad transactions are skipped below, but still count for page
+        if len(transactions_rows) == end - start:
+            next_cursor = _encode_transaction_cursor(transactions_rows[-1])
 
         for transaction_row in transactions_rows:
             # filter bad transactions
@@ -648,10 +1096,19 @@ class Blockchain:
 
             transactions.append(tx)
 
-        return transactions
+        return transactions, next_cursor
 
 
     def get_n_unconfirmed_transactions(self, session: Session) -> int:
+        n = self._get_chain_counter(session, 'n_unconfirmed_transactions')
+
+        if n is not None:
+            return n
+
+        return self._query_n_unconfirmed_transactions(session)
+
+
+    def _query_n_unconfirmed_transactions(self, session: Session) -> int:
         q = session.query(TransactionModel)
         q = q.filter(TransactionModel.confirmed == False)
         q = q.filter(TransactionModel.amount >= 0)
@@ -665,6 +1122,9 @@ class Blockchain:
         if transaction.amount < 0:
             raise BlockchainError('negative value')
 
+        if transaction.amount > MAX_AMOUNT or transaction.fee > MAX_AMOUNT:
+            raise BlockchainError('value too large')
+
         # check fee
         if transaction.fee < self.fee_amount:
             raise BlockchainError('not enough fee')
@@ -712,6 +1172,7 @@ class Blockchain:
         )
 
         session.add(tx_row)
+        self._add_chain_counters(session, {'n_unconfirmed_transactions': 1})
         session.flush()
 
 
@@ -780,7 +1241,13 @@ class Blockchain:
         return b
 
 
-    def get_blocks_range(self, session: Session, start: int, end: int=None, is_reversed: bool=False) -> List[Block]:
+    def get_blocks_range(self, session: Session, start: int, end: int=None, is_reversed: bool=False,
+                         cursor: Optional[str]=None) -> Tuple[List[Block], Optional[str]]:
+        '''
+        Returns blocks ordered by height, and cursor of next page, or None
+        if it is last page. If cursor is given, start and end count from
+        block right after cursor.
+        '''
         if end is None:
             end = start + 15_000
 
@@ -791,11 +1258,19 @@ class Blockchain:
         assert end - start <= 15_000
 
         q = session.query(BlockModel)
+
+        if cursor is not None:
+            q = q.filter(_after_key([BlockModel.height], _decode_block_cursor(cursor), is_reversed))
+
         q = q.order_by(BlockModel.height.desc() if is_reversed else BlockModel.height.asc())
         q = q.offset(start)
         q = q.limit(end - start)
         blocks_rows = q.all()
         blocks = []
+        next_cursor = None
+
+        if len(blocks_rows) == end - start:
+            next_cursor = _encode_block_cursor(blocks_rows[-1])
 
         for block_row in blocks_rows:
             transactions = json.loads(block_row.transactions)
@@ -821,10 +1296,19 @@ class Blockchain:
 
             blocks.append(b)
 
-        return blocks
+        return blocks, next_cursor
 
 
     def get_n_blocks(self, session: Session) -> int:
+        n = self._get_chain_counter(session, 'n_blocks')
+
+        if n is not None:
+            return n
+
+        return self._query_n_blocks(session)
+
+
+    def _query_n_blocks(self, session: Session) -> int:
         q = session.query(BlockModel)
         n = q.count()
         return n
@@ -842,6 +1326,11 @@ class Blockchain:
         if not block.verify():
             raise BlockchainError('block could not be verified')
 
+        # check amounts and fees of all transactions, including genesis block
+        for tx in block.transactions:
+            if not 0 <= tx.amount <= MAX_AMOUNT or not 0 <= tx.fee <= MAX_AMOUNT:
+                raise BlockchainError(f'wrong transaction: amount or fee out of range {tx.id!r}')
+
         # check first/reward transaction
         # TODO: specialized functions for checking correctness of transactions fields
         if block.height > 0:
@@ -962,7 +1451,7 @@ class Blockchain:
         if block.height > 0:
             # plain block
             send_by_address = {}
-            addresses = [tx.sender_address for tx in block.transactions if tx.sender_address]
+            addresses = set([tx.sender_address for tx in block.transactions if tx.sender_address])
 
             # skip first/reward transaction
             # first/reward transaction is already checked above
@@ -988,7 +1477,7 @@ class Blockchain:
             time=block.time,
             time_dt=parse(block.time),
             time_ts=parse(block.time).timestamp(),
-            transactions=json.dumps([tx.to_dict() for tx in block.transactions]),
+            transactions=block.get_transactions_message(),
             merkle_root=block.merkle_root,
             difficulty=block.difficulty,
             nonce=block.nonce,
@@ -1009,7 +1498,7 @@ class Blockchain:
         unconfirmed_transactions_rows = q.all()
 
         for tx_row in unconfirmed_transactions_rows:
-            tx_row.block = block.id
+            tx_row.block_id = block.id
             tx_row.confirmed = True
 
         unconfirmed_transactions_rows_ids = set([tx_row.id for tx_row in unconfirmed_transactions_rows])
@@ -1042,7 +1531,37 @@ class Blockchain:
 
             session.add(tx_row)
 
+        # rollups
+        self._add_volume_rollups(session, [
+            (parse(tx.time), tx.amount)
+            for tx in block.transactions
+            if tx.sender_address is None
+        ])
+
+        self._add_address_balances(session, [
+            (tx_row.sender_address, tx_row.recipient_address, tx_row.amount, tx_row.fee)
+            for tx_row in unconfirmed_transactions_rows
+        ] + [
+            (tx.sender_address, tx.recipient_address, tx.amount, tx.fee)
+            for tx in block.transactions
+            if tx.id not in unconfirmed_transactions_rows_ids
+        ])
+
+        self._add_chain_counters(session, {
+            'n_blocks': 1,
+            'n_transactions': len(block.transactions),
+            'n_unconfirmed_transactions': -sum(1 for tx_row in unconfirmed_transactions_rows if tx_row.amount >= 0 and tx_row.fee >= 0),
+            'total_supply_amount': sum(tx.amount for tx in block.transactions if tx.sender_address is None),
+        })
+
+        # rollups of chain which starts with this block are complete
+        if block.height == 0:
+            self._set_rollup(session, 'volume')
+            self._set_rollup(session, 'address_balance')
+            self._set_rollup(session, 'chain_counters')
+
         session.flush()
+        self.generation += 1
 
 
     def add_blocks(self, session: Session, blocks: List[Block], check_difficulty=True):
@@ -1055,21 +1574,30 @@ class Blockchain:
         return block.verify()
 
 
-    def mine_block(self, block: Block) -> Block:
-        b = block.mine()
+    def mine_block(self, block: Block, workers: int=0) -> Block:
+        # abort mining once chain tip or difficulty changes
+        generation = self.generation
+        b = block.mine(workers, lambda: self.generation != generation)
         return b
 
 
     async def submit_block(self, block: Block) -> bool:
-        async with ClientSession() as client_session:
+        async with ClientSession(json_serialize=codec.dumps_str) as client_session:
             url = f'{Config.COORDINATOR}/v1/block/add'
-            data = {'block': block.to_dict()}
 
-            async with client_session.post(url, json=data) as res:
+            if Config.WIRE_FORMAT == 'binary':
+                message = block.serialize_wire()
+                headers = {'Content-Type': wire.CONTENT_TYPE}
+                request = client_session.post(url, data=message, headers=headers)
+            else:
+                data = {'block': block.to_dict()}
+                request = client_session.post(url, json=data)
+
+            async with request as res:
                 data = await res.json()
                 # log.debug(data)
 
                 if data['status'] == 'error':
-                    raise BlockchainError(f'could not submit block: {data!r}')
+                    raise BlockchainError(f'could not submit block: {data.get("message")}')
 
         return True
\ No newline at end of file
@@ -0,0 +1,80 @@
+'''
+JSON codec used for requests and responses.
+
+Encodes using orjson if it is installed, otherwise standard library json.
+orjson does not support integers wider than 64 bits (e.g. block difficulty),
+so objects with them are encoded by standard library json, unless values
+known to be wide are wrapped by `wide_int`.
+
+Decoding stays on standard library json, orjson silently decodes wide
+integers as floats, and it is only marginally faster on payloads that
+are mostly hex strings.
+
+Canonical hash and signature preimages are always encoded by `dumps_canonical`,
+which is standard library json, so they stay byte for byte same.
+'''
+from typing import Union
+import re
+import os
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+available = orjson is not None
+
+# wide integers are encoded by orjson as marked strings, then unquoted,
+# random token makes marker impossible to forge by strings in payload
+_WIDE_INT_TOKEN = os.urandom(8).hex()
+_WIDE_INT_PREFIX = '\x1f' + _WIDE_INT_TOKEN
+_WIDE_INT_SUFFIX = '\x1f'
+_WIDE_INT_ENCODED_PREFIX = ('\\u001f' + _WIDE_INT_TOKEN).encode()
+_WIDE_INT_RE = re.compile(b'"' + re.escape(_WIDE_INT_ENCODED_PREFIX) + rb'(-?[0-9]+)\\u001f"')
+
+
+def wide_int(n: int) -> Union[int, str]:
+    '''
+    Wraps integer which might not fit in 64 bits, so it can be encoded
+    by `dumps` using orjson. Use it only for data passed to `dumps`.
+    '''
+    if orjson is None or -2 ** 63 <= n < 2 ** 64:
+        return n
+
+    return f'{_WIDE_INT_PREFIX}{int(n)}{_WIDE_INT_SUFFIX}'
+
+
+def dumps(obj) -> bytes:
+    '''
+    Encodes object to JSON bytes, using orjson if possible.
+    '''
+    message = None
+
+    if orjson is not None:
+        try:
+            message = orjson.dumps(obj)
+        except TypeError as e:
+            # e.g. integer wider than 64 bits
+            pass
+
+    if message is None:
+        message = json.dumps(obj).encode()
+
+    if _WIDE_INT_ENCODED_PREFIX in message:
+        message = _WIDE_INT_RE.sub(rb'\1', message)
+
+    return message
+
+
+def dumps_str(obj) -> str:
+    return dumps(obj).decode()
+
+
+def dumps_canonical(obj) -> str:
+    '''
+    Encodes hash and signature preimages. Output must never change,
+    otherwise existing hashes and signatures do not verify.
+    '''
+    return json.dumps(obj)
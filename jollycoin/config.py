@@ -10,4 +10,15 @@ class Config:
     NO_SYNC = False
     NO_MINE = False
     GENERATE_GENESIS_BLOCK = False
-    MINER_ADDRESS = None
\ No newline at end of file
+    MIGRATE_V1_TABLES = False
+    REBUILD_VOLUME_ROLLUPS = False
+    CHECK_VOLUME_ROLLUPS = False
+    REBUILD_ADDRESS_BALANCES = False
+    CHECK_ADDRESS_BALANCES = False
+    REBUILD_CHAIN_COUNTERS = False
+    CHECK_CHAIN_COUNTERS = False
+    MINER_ADDRESS = None
+    MINER_WORKERS = 1
+    VERIFY_WORKERS = None
+    WIRE_FORMAT = 'json'
+    ADDRESS_INFO_LIMIT = 1_000
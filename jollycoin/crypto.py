@@ -1,9 +1,18 @@
+from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import os
 import math
+import time
+import hashlib
+import functools
+import threading
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import ec
 
+from .config import Config
+
 
 class sha256:
     def __init__(self, message: bytes=None):
@@ -29,6 +38,34 @@ class sha256:
         return hexdigest
 
 
+class sha256_prefix:
+    '''
+    Absorbs message prefix once, then hashes many different suffixes
+    starting from cloned state of already hashed prefix.
+    '''
+    def __init__(self, prefix: bytes):
+        self.state = hashlib.sha256(prefix)
+
+
+    def digest(self, suffix: bytes) -> bytes:
+        h = self.state.copy()
+        h.update(suffix)
+        digest = h.digest()
+        return digest
+
+
+    def hexdigest(self, suffix: bytes) -> str:
+        hexdigest = self.digest(suffix).hex()
+        return hexdigest
+
+
+    def intdigest(self, suffix: bytes) -> int:
+        h = self.state.copy()
+        h.update(suffix)
+        intdigest = int.from_bytes(h.digest(), byteorder='big')
+        return intdigest
+
+
 def generate_private_key() -> str:
     # private key
     _private_key = ec.generate_private_key(
@@ -95,8 +132,9 @@ def generate_private_public_address_key() -> (str, str):
     return private_key, public_key, address
 
 
-def sign_message(private_key: str, message: str) -> str:
-    # private key
+@functools.lru_cache(maxsize=256)
+def _load_private_key(private_key: str) -> ec.EllipticCurvePrivateKey:
+    # NOTE: cached, senders usually sign many messages with same key
     private_key_bytes = bytes.fromhex(private_key)
     private_key_int = int.from_bytes(private_key_bytes, byteorder='big')
     
@@ -106,6 +144,38 @@ def sign_message(private_key: str, message: str) -> str:
         default_backend(),
     )
 
+    return _private_key
+
+
+@functools.lru_cache(maxsize=4096)
+def _load_public_key(public_key: str) -> ec.EllipticCurvePublicKey:
+    # NOTE: cached by encoded point, decoding point on curve is expensive
+    #       and same senders verify many transactions
+    public_key_bytes = bytes.fromhex(public_key)
+
+    _public_key_numbers = ec.EllipticCurvePublicNumbers.from_encoded_point(
+        ec.SECP256K1(),
+        public_key_bytes,
+    )
+
+    _public_key = _public_key_numbers.public_key(default_backend())
+    return _public_key
+
+
+def get_key_cache_info() -> Dict[str, Dict[str, int]]:
+    '''
+    Hits, misses, size and max size of parsed private/public keys caches.
+    '''
+    return {
+        'private_key': _load_private_key.cache_info()._asdict(),
+        'public_key': _load_public_key.cache_info()._asdict(),
+    }
+
+
+def sign_message(private_key: str, message: str) -> str:
+    # private key
+    _private_key = _load_private_key(private_key)
+
     # sign
     message_bytes = message.encode()
 
@@ -120,15 +190,8 @@ def sign_message(private_key: str, message: str) -> str:
 
 def verify_message(public_key: str, signature: str, message: str) -> bool:
     # public key
-    public_key_bytes = bytes.fromhex(public_key)
+    _public_key = _load_public_key(public_key)
     signature_bytes = bytes.fromhex(signature)
-    
-    _public_key_numbers = ec.EllipticCurvePublicNumbers.from_encoded_point(
-        ec.SECP256K1(),
-        public_key_bytes,
-    )
-
-    _public_key = _public_key_numbers.public_key(default_backend())
 
     # verify
     message_bytes = message.encode()
@@ -147,6 +210,85 @@ def verify_message(public_key: str, signature: str, message: str) -> bool:
     return verified
 
 
+def _verify_chunk(items: List[Tuple[str, str, str]]) -> List[bool]:
+    verified = []
+
+    for public_key, signature, message in items:
+        try:
+            v = verify_message(public_key, signature, message)
+        except Exception as e:
+            # malformed public key or signature
+            v = False
+
+        verified.append(v)
+
+    return verified
+
+
+_verify_executor = None
+_verify_executor_lock = threading.Lock()
+
+
+def _get_verify_executor() -> ProcessPoolExecutor:
+    # persistent pool, created once, also from executor threads
+    global _verify_executor
+
+    with _verify_executor_lock:
+        if _verify_executor is None:
+            _verify_executor = ProcessPoolExecutor(max_workers=Config.VERIFY_WORKERS)
+
+        return _verify_executor
+
+
+def start_verify_executor():
+    '''
+    Creates verification pool and starts its worker processes. Node
+    calls it at startup, before it runs any thread, so workers are
+    forked from single threaded process and no lock is copied held.
+
+    Workers are forked, because spawned and forkserver workers import
+    main module, and node runs at import of node.py.
+    '''
+    workers = os.cpu_count() if Config.VERIFY_WORKERS is None else Config.VERIFY_WORKERS
+
+    if workers <= 1:
+        return
+
+    # pool forks workers for pending tasks, so keep them all pending
+    executor = _get_verify_executor()
+    list(executor.map(time.sleep, [0.05] * workers))
+
+
+def shutdown_verify_executor():
+    global _verify_executor
+
+    with _verify_executor_lock:
+        if _verify_executor is not None:
+            _verify_executor.shutdown()
+            _verify_executor = None
+
+
+def verify_many(items: List[Tuple[str, str, str]], chunk_size: int=64) -> List[bool]:
+    '''
+    Verifies many (public_key, signature, message) items, and returns
+    verified flag per item. Malformed keys and signatures are not verified.
+    Large batches are verified in chunks by persistent process pool.
+    '''
+    workers = os.cpu_count() if Config.VERIFY_WORKERS is None else Config.VERIFY_WORKERS
+
+    if workers <= 1 or len(items) <= chunk_size:
+        return _verify_chunk(items)
+
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    executor = _get_verify_executor()
+    verified = []
+
+    for v in executor.map(_verify_chunk, chunks):
+        verified.extend(v)
+
+    return verified
+
+
 if __name__ == '__main__':
     sk0 = generate_private_key()
     pk0 = get_public_key(sk0)
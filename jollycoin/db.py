@@ -3,7 +3,7 @@ from decimal import Decimal
 from datetime import datetime
 
 from sqlalchemy import create_engine, event, exc
-from sqlalchemy import Column, Index, Boolean, BigInteger, Float, Numeric, String, DateTime, Text
+from sqlalchemy import Column, Index, Boolean, BigInteger, Float, Numeric, String, DateTime, Text, LargeBinary
 from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
@@ -61,6 +61,38 @@ class StringLike(TypeDecorator):
         return value
 
 
+class BigIntegerLike(TypeDecorator):
+    # some drivers return sums of integers as Decimal
+    impl = BigInteger
+
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            return int(value)
+
+        return value
+
+
+class UInt256(TypeDecorator):
+    # unsigned 256 bit integer as fixed size big-endian bytes,
+    # so ordering of bytes is same as ordering of integers
+    impl = LargeBinary(32)
+
+
+    def process_bind_param(self, value, dialect):
+        if value is not None:
+            return int(value).to_bytes(32, byteorder='big')
+
+        return None
+
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            return int.from_bytes(value, byteorder='big')
+
+        return value
+
+
 class _Base:
     created_at = Column(DateTime(), default=datetime.utcnow)
     updated_at = Column(DateTime(), onupdate=datetime.utcnow)
@@ -90,8 +122,7 @@ class _Base:
 Base = declarative_base(cls=_Base)
 
 
-class TransactionModel(Base):
-    __tablename__ = 'transaction_v1'
+class _TransactionColumns:
     block_id = Column(String(64), default=None, index=True)
     confirmed = Column(Boolean, default=False, index=True)
 
@@ -103,15 +134,34 @@ class TransactionModel(Base):
     sender_address = Column(String(65), index=True)
     recipient_address = Column(String(65), index=True)
     sender_public_key = Column(String(256))
-    amount = Column(StringLike(128))
-    fee = Column(StringLike(128))
     signature = Column(String(256))
     hash = Column(String(64))
     message = Column(Text)
 
 
-class BlockModel(Base):
-    __tablename__ = 'block_v1'
+class TransactionModel(_TransactionColumns, Base):
+    __tablename__ = 'transaction_v2'
+
+    # address history in time order, see `Blockchain.get_address_transactions`
+    __table_args__ = (
+        Index('ix_transaction_v2_sender_history', 'sender_address', 'confirmed', 'time_dt', 'id'),
+        Index('ix_transaction_v2_recipient_history', 'recipient_address', 'confirmed', 'time_dt', 'id'),
+        # transaction ranges, see `Blockchain.get_transactions_range`
+        Index('ix_transaction_v2_range', 'confirmed', 'time_dt', 'id'),
+    )
+
+    amount = Column(BigIntegerLike)
+    fee = Column(BigIntegerLike)
+
+
+class TransactionModelV1(_TransactionColumns, Base):
+    # integers as strings, see `migrate`
+    __tablename__ = 'transaction_v1'
+    amount = Column(StringLike(128))
+    fee = Column(StringLike(128))
+
+
+class _BlockColumns:
     version = Column(String(8))
     height = Column(BigInteger, index=True, unique=True)
     id = Column(String(64), primary_key=True)
@@ -121,11 +171,66 @@ class BlockModel(Base):
     time_ts = Column(BigInteger, index=True)
     transactions = Column(Text)
     merkle_root = Column(String(64))
-    difficulty = Column(StringLike(128))
-    nonce = Column(StringLike(128))
     hash = Column(String(64))
     message = Column(Text)
 
 
-# create all tables
-Base.metadata.create_all(engine)
+class BlockModel(_BlockColumns, Base):
+    __tablename__ = 'block_v2'
+    difficulty = Column(UInt256)
+    nonce = Column(UInt256)
+
+
+class BlockModelV1(_BlockColumns, Base):
+    # integers as strings, see `migrate`
+    __tablename__ = 'block_v1'
+    difficulty = Column(StringLike(128))
+    nonce = Column(StringLike(128))
+
+
+class VolumeHourlyModel(Base):
+    __tablename__ = 'volume_hourly_v1'
+    bucket = Column(DateTime, primary_key=True)
+    volume = Column(StringLike(128))
+
+
+class VolumeDailyModel(Base):
+    __tablename__ = 'volume_daily_v1'
+    bucket = Column(DateTime, primary_key=True)
+    volume = Column(StringLike(128))
+
+
+class VolumeMonthlyModel(Base):
+    __tablename__ = 'volume_monthly_v1'
+    bucket = Column(DateTime, primary_key=True)
+    volume = Column(StringLike(128))
+
+
+class AddressBalanceModel(Base):
+    __tablename__ = 'address_balance_v1'
+    address = Column(String(65), primary_key=True)
+    total_received = Column(StringLike(128))
+    total_sent = Column(StringLike(128))
+    total_fee = Column(StringLike(128))
+    balance = Column(StringLike(128))
+
+
+class ChainCounterModel(Base):
+    # counters of whole chain, see `Blockchain.get_n_blocks`
+    __tablename__ = 'chain_counter_v1'
+    name = Column(String(64), primary_key=True)
+    value = Column(BigIntegerLike)
+
+
+class RollupStateModel(Base):
+    # rollup tables which are complete, i.e. built from whole chain
+    __tablename__ = 'rollup_state_v1'
+    name = Column(String(64), primary_key=True)
+
+
+# create all tables, except v1 tables which only existing databases have
+Base.metadata.create_all(engine, tables=[
+    table
+    for table in Base.metadata.sorted_tables
+    if table not in (TransactionModelV1.__table__, BlockModelV1.__table__)
+])
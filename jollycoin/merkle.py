@@ -1,17 +1,212 @@
+from typing import Iterable, Optional, List, Tuple
 import hashlib
 import binascii
 
 
+def _hash_pairs(hash_function, buf, start: int, n_pairs: int, width: int) -> List[bytes]:
+    # pair of adjacent nodes in contiguous level is already concatenated,
+    # and slices of memoryview are not copied
+    w2 = 2 * width
+    view = memoryview(buf)
+    return [hash_function(view[i:i + w2]).digest() for i in range(start, start + n_pairs * w2, w2)]
+
+
+def _level_root(hash_function, level: List[bytes]) -> bytes:
+    while len(level) > 1:
+        nodes = iter(level)
+        next_level = [hash_function(l + r).digest() for l, r in zip(nodes, nodes)]
+
+        if len(level) % 2 == 1:
+            next_level.append(level[-1])
+
+        level = next_level
+
+    return level[0]
+
+
+def _buffer_root(hash_function, buf: bytes, n: int, width: int) -> bytes:
+    # leaves level, half of all hashes, is hashed right from buffer,
+    # upper levels are short enough to be lists of digests
+    if n == 1:
+        return bytes(buf[:width])
+
+    level = _hash_pairs(hash_function, buf, 0, n // 2, width)
+
+    if n % 2 == 1:
+        level.append(bytes(buf[(n - 1) * width:n * width]))
+
+    return _level_root(hash_function, level)
+
+
+def merkle_root(leaves: Iterable[bytes], hash_function=hashlib.sha256) -> Optional[bytes]:
+    '''
+    Returns merkle root of leaves without keeping the tree,
+    or None if there are no leaves.
+
+    Node without pair (last one on level with odd number of nodes)
+    is carried up to next level as it is.
+    '''
+    level = list(leaves)
+
+    if not level:
+        return None
+
+    width = hash_function().digest_size
+
+    # leaves which are not digests are concatenated as they are
+    if any(len(v) != width for v in level):
+        return bytes(_level_root(hash_function, level))
+
+    return _buffer_root(hash_function, b''.join(level), len(level), width)
+
+
+def merkle_root_hex(leaves: List[str], hash_function=hashlib.sha256) -> Optional[str]:
+    '''
+    Same as `merkle_root`, but leaves and root are hex strings.
+    Raises ValueError if leaf is not hex string.
+    '''
+    if not leaves:
+        return None
+
+    width = hash_function().digest_size
+
+    # digests are parsed all at once, if every leaf is
+    # 2 * width characters long and all are hex digits
+    if all(len(v) == 2 * width for v in leaves):
+        try:
+            buf = bytes.fromhex(''.join(leaves))
+        except ValueError as e:
+            buf = None
+
+        if buf is not None and len(buf) == len(leaves) * width:
+            return _buffer_root(hash_function, buf, len(leaves), width).hex()
+
+    return merkle_root([bytes.fromhex(v) for v in leaves], hash_function).hex()
+
+
+class MerkleAccumulator(object):
+    '''
+    Append-only merkle tree, which keeps only frontier of right-edge
+    nodes (roots of perfect subtrees), so adding leaf and getting root
+    are O(log n), and roots are same as `Merkle.make_tree` roots.
+
+    With node without pair carried up, root is right fold of frontier
+    nodes, from smallest subtree to largest one.
+
+    It also keeps right siblings of first leaf path, so first leaf
+    (e.g. reward transaction of block template) can be replaced
+    in O(log n) as well.
+    '''
+    def __init__(self, hash_type="sha256"):
+        hash_type = hash_type.lower()
+        self.hash_function = getattr(hashlib, hash_type)
+        self.n_leaves = 0
+        self.first_leaf = None
+        self.frontier = []        # node of level, or None
+        self.first_siblings = []  # right sibling of first leaf path, per level
+
+
+    def __len__(self):
+        return self.n_leaves
+
+
+    def copy(self):
+        m = MerkleAccumulator.__new__(MerkleAccumulator)
+        m.hash_function = self.hash_function
+        m.n_leaves = self.n_leaves
+        m.first_leaf = self.first_leaf
+        m.frontier = list(self.frontier)
+        m.first_siblings = list(self.first_siblings)
+        return m
+
+
+    def add_leaf(self, leaf: bytes):
+        if self.n_leaves == 0:
+            self.first_leaf = leaf
+
+        node = leaf
+        level = 0
+        self.n_leaves += 1
+
+        while level < len(self.frontier) and self.frontier[level] is not None:
+            left = self.frontier[level]
+            self.frontier[level] = None
+            level += 1
+
+            # node covers leaves from first one
+            if self.n_leaves == 1 << level:
+                self.first_siblings.append(node)
+
+            node = self.hash_function(left + node).digest()
+
+        if level == len(self.frontier):
+            self.frontier.append(node)
+        else:
+            self.frontier[level] = node
+
+
+    def add_leaves(self, leaves: Iterable[bytes]):
+        for leaf in leaves:
+            self.add_leaf(leaf)
+
+
+    def replace_first_leaf(self, leaf: bytes):
+        if self.n_leaves == 0:
+            raise IndexError('no leaves')
+
+        # largest subtree, containing first leaf
+        node = leaf
+
+        for sibling in self.first_siblings:
+            node = self.hash_function(node + sibling).digest()
+
+        self.first_leaf = leaf
+        self.frontier[len(self.first_siblings)] = node
+
+
+    def get_root(self) -> Optional[bytes]:
+        root = None
+
+        for node in self.frontier:
+            if node is None:
+                continue
+            elif root is None:
+                root = node
+            else:
+                root = self.hash_function(node + root).digest()
+
+        return root
+
+
+    def get_merkle_root(self) -> Optional[str]:
+        root = self.get_root()
+
+        if root is not None:
+            return root.hex()
+
+        return None
+
+
 class Merkle(object):
+    '''
+    Merkle tree. If all leaves are digests, whole tree is kept in single
+    contiguous buffer, level by level starting from leaves. `make_tree`
+    computes only root, buffer is built on first use of `levels` or
+    `get_proof`.
+    '''
     def __init__(self, hash_type="sha256"):
         hash_type = hash_type.lower()
         self.hash_function = getattr(hashlib, hash_type)
+        self.width = self.hash_function().digest_size
         self.reset_tree()
 
 
     def reset_tree(self):
         self.leaves = list()
-        self.levels = None
+        self.tree = None
+        self.level_offsets = None
+        self.level_sizes = None
+        self.root = None
         self.is_ready = False
 
 
@@ -19,54 +214,151 @@ class Merkle(object):
         # check if single leaf
         if not isinstance(values, tuple) and not isinstance(values, list):
             values = [values]
-        
-        for v in values:
-            if do_hash:
-                v = v.encode('utf-8')
-                v = self.hash_function(v).hexdigest()
-            
-            v = bytearray.fromhex(v)
-            self.leaves.append(v)
-
-
-    def _calculate_next_level(self):
-        solo_leave = None
-
-        # number of leaves on the level
-        N = len(self.levels[0])
-        
-        # if odd number of leaves on the level
-        if N % 2 == 1:
-            solo_leave = self.levels[0][-1]
-            N -= 1
-
-        new_level = []
-        
-        for l, r in zip(self.levels[0][0:N:2], self.levels[0][1:N:2]):
-            new_level.append(self.hash_function(l+r).digest())
-        
-        if solo_leave is not None:
-            new_level.append(solo_leave)
-        
-        # prepend new level
-        self.levels = [new_level, ] + self.levels
+
+        if do_hash:
+            values = [self.hash_function(v.encode('utf-8')).hexdigest() for v in values]
+
+        self.leaves.extend(map(bytes.fromhex, values))
 
 
     def make_tree(self):
-        if self.leaves:
-            self.levels = [self.leaves]
-            
-            while len(self.levels[0]) > 1:
-                self._calculate_next_level()
+        if not self.leaves:
+            return
+
+        self.tree = None
+        self.level_offsets = None
+        self.level_sizes = None
+
+        if any(len(v) != self.width for v in self.leaves):
+            # no fixed size nodes, root only
+            self.root = merkle_root(self.leaves, self.hash_function)
+        else:
+            self.root = _buffer_root(self.hash_function, b''.join(self.leaves), len(self.leaves), self.width)
+
+        self.is_ready = True
+
+
+    def _make_levels(self) -> bool:
+        '''
+        Builds buffer of all levels, returns False if leaves are not digests.
+        '''
+        if self.tree is not None:
+            return True
+
+        if not self.is_ready or any(len(v) != self.width for v in self.leaves):
+            return False
+
+        width = self.width
+        sizes = [len(self.leaves)]
+
+        while sizes[-1] > 1:
+            sizes.append(sizes[-1] // 2 + sizes[-1] % 2)
+
+        offsets = [0]
+
+        for n in sizes[:-1]:
+            offsets.append(offsets[-1] + n * width)
+
+        tree = bytearray(offsets[-1] + width)
+        tree[:sizes[0] * width] = b''.join(self.leaves)
+
+        for i in range(len(sizes) - 1):
+            start = offsets[i]
+            n = sizes[i]
+            dst = offsets[i + 1]
+            n_pairs = n // 2
+            tree[dst:dst + n_pairs * width] = b''.join(_hash_pairs(self.hash_function, tree, start, n_pairs, width))
+
+            if n % 2 == 1:
+                # carry up node without pair
+                tree[dst + n_pairs * width:dst + (n_pairs + 1) * width] = tree[start + (n - 1) * width:start + n * width]
+
+        self.tree = tree
+        self.level_offsets = offsets
+        self.level_sizes = sizes
+        return True
+
+
+    @property
+    def levels(self) -> Optional[List[List[bytes]]]:
+        '''
+        Levels of tree as lists of nodes, starting from root.
+        '''
+        if not self._make_levels():
+            return None
+
+        w = self.width
+        levels = []
+
+        for offset, n in zip(self.level_offsets, self.level_sizes):
+            levels.append([bytes(self.tree[offset + i * w:offset + (i + 1) * w]) for i in range(n)])
+
+        levels.reverse()
+        return levels
 
 
     def get_merkle_root(self):
-        if self.levels is not None:
-            return self.levels[0][0].hex()
-        
+        if self.root is not None:
+            return self.root.hex()
+
         return None
 
 
+    def get_proof(self, index: int) -> List[Tuple[str, str]]:
+        '''
+        Returns audit path of leaf at index, from leaf up to root,
+        as list of (side, hash) pairs, where side ('left' or 'right')
+        is position of sibling hash. Node without pair is carried
+        up as it is, so it has no step on that level.
+        '''
+        if not self._make_levels():
+            raise ValueError('tree of digests is not made')
+
+        if not 0 <= index < self.level_sizes[0]:
+            raise IndexError('leaf index out of range')
+
+        w = self.width
+        proof = []
+
+        for offset, n in zip(self.level_offsets[:-1], self.level_sizes[:-1]):
+            if index % 2 == 1:
+                side, sibling = 'left', index - 1
+            elif index + 1 < n:
+                side, sibling = 'right', index + 1
+            else:
+                side, sibling = None, None
+
+            if side is not None:
+                proof.append((side, self.tree[offset + sibling * w:offset + (sibling + 1) * w].hex()))
+
+            index //= 2
+
+        return proof
+
+
+    @staticmethod
+    def verify_proof(leaf: str, proof: List[Tuple[str, str]], root: str, hash_type="sha256") -> bool:
+        '''
+        Verifies that leaf with audit path from `get_proof` leads to root.
+        '''
+        hash_function = getattr(hashlib, hash_type.lower())
+
+        try:
+            h = bytes.fromhex(leaf)
+
+            for side, sibling in proof:
+                if side == 'left':
+                    h = hash_function(bytes.fromhex(sibling) + h).digest()
+                elif side == 'right':
+                    h = hash_function(h + bytes.fromhex(sibling)).digest()
+                else:
+                    return False
+        except (TypeError, ValueError) as e:
+            return False
+
+        return isinstance(root, str) and h.hex() == root.lower()
+
+
 if __name__ == '__main__':
     m = Merkle()
     m.add_leaf('123', True)
@@ -74,4 +366,4 @@ if __name__ == '__main__':
     m.add_leaf('345')
     m.make_tree()
     r = m.get_merkle_root()
-    print(f'r: {r!r}')
\ No newline at end of file
+    print(f'r: {r!r}')
@@ -0,0 +1,190 @@
+'''
+Migration of v1 tables to v2 tables.
+
+v1 tables store integers (amount, fee, difficulty, nonce) as strings,
+so aggregates sum strings and filters compare text. v2 tables store
+amounts and fees as native integers, and 256 bit difficulty and nonce
+as fixed size bytes.
+
+Rows are copied in batches ordered by primary key, each batch in its
+own database transaction, and rows which already exist in v2 tables
+are skipped, so migration can be interrupted and resumed at any time.
+Once all rows are copied, it is marked as done, and v1 tables are left
+as they are.
+
+Migration is offline: node does not start while v1 tables have rows
+which are not migrated (see `needs_migration`), and there is no dual
+write to v1 and v2 tables, so node is stopped, started once with
+--migrate-v1-tables, and serves from v2 tables after it.
+
+v1 nodes stored transactions, which were confirmed while unconfirmed,
+without block id, so migration also sets it from transactions of blocks.
+'''
+from typing import Dict
+import json
+
+from sqlalchemy import inspect
+
+from .db import engine, Session, TransactionModel, TransactionModelV1, BlockModel, BlockModelV1, RollupStateModel
+from . import log
+
+
+MIGRATIONS = [
+    [BlockModelV1, BlockModel],
+    [TransactionModelV1, TransactionModel],
+]
+
+MIGRATED = 'v2_tables'
+
+
+def _has_v1_rows() -> bool:
+    table_names = inspect(engine).get_table_names()
+    session = Session()
+
+    try:
+        for v1_model, v2_model in MIGRATIONS:
+            if v1_model.__tablename__ in table_names and session.query(v1_model.id).first() is not None:
+                return True
+    finally:
+        session.close()
+
+    return False
+
+
+def is_migrated() -> bool:
+    session = Session()
+
+    try:
+        q = session.query(RollupStateModel)
+        q = q.filter(RollupStateModel.name == MIGRATED)
+        return q.first() is not None
+    finally:
+        session.close()
+
+
+def needs_migration() -> bool:
+    '''
+    Returns True if database has v1 rows which are not migrated yet.
+    '''
+    return not is_migrated() and _has_v1_rows()
+
+
+def migrate_v1_tables(batch_size: int=1_000) -> Dict[str, int]:
+    '''
+    Copies rows of v1 tables to v2 tables, returns number of copied
+    rows per v2 table.
+    '''
+    table_names = inspect(engine).get_table_names()
+    n_rows = {}
+
+    for v1_model, v2_model in MIGRATIONS:
+        n_rows[v2_model.__tablename__] = 0
+
+        if v1_model.__tablename__ not in table_names:
+            continue
+
+        last_id = None
+
+        while True:
+            session = Session()
+
+            try:
+                q = session.query(v1_model)
+
+                if last_id is not None:
+                    q = q.filter(v1_model.id > last_id)
+
+                q = q.order_by(v1_model.id)
+                q = q.limit(batch_size)
+                rows = q.all()
+
+                if not rows:
+                    break
+
+                q = session.query(v2_model.id)
+                q = q.filter(v2_model.id.in_([row.id for row in rows]))
+                existing_ids = set(r.id for r in q)
+
+                session.bulk_insert_mappings(v2_model, [
+                    row.to_dict()
+                    for row in rows
+                    if row.id not in existing_ids
+                ])
+
+                session.commit()
+                last_id = rows[-1].id
+                n_rows[v2_model.__tablename__] += len(rows) - len(existing_ids)
+            finally:
+                session.close()
+
+            log.info(f'migrated {v1_model.__tablename__} to {v2_model.__tablename__}: {n_rows[v2_model.__tablename__]} rows')
+
+    n_rows['block_id'] = backfill_block_ids(batch_size)
+    session = Session()
+
+    try:
+        if not is_migrated():
+            session.add(RollupStateModel(name=MIGRATED))
+            session.commit()
+    finally:
+        session.close()
+
+    return n_rows
+
+
+def backfill_block_ids(batch_size: int=1_000) -> int:
+    '''
+    Sets block id of confirmed transactions stored without it, reading
+    blocks in batches by height. Returns number of updated transactions.
+    '''
+    session = Session()
+
+    try:
+        q = session.query(TransactionModel.id)
+        q = q.filter(TransactionModel.confirmed == True)
+        q = q.filter(TransactionModel.block_id == None)
+        q = q.yield_per(10_000)
+        transaction_ids = set(r.id for r in q)
+    finally:
+        session.close()
+
+    n_rows = 0
+    last_height = None
+
+    while transaction_ids:
+        session = Session()
+
+        try:
+            q = session.query(BlockModel.id, BlockModel.height, BlockModel.transactions)
+
+            if last_height is not None:
+                q = q.filter(BlockModel.height > last_height)
+
+            q = q.order_by(BlockModel.height)
+            q = q.limit(batch_size)
+            blocks_rows = q.all()
+
+            if not blocks_rows:
+                break
+
+            mappings = []
+
+            for block_row in blocks_rows:
+                for tx in json.loads(block_row.transactions):
+                    if tx['id'] in transaction_ids:
+                        transaction_ids.discard(tx['id'])
+                        mappings.append({'id': tx['id'], 'block_id': block_row.id})
+
+            session.bulk_update_mappings(TransactionModel, mappings)
+            session.commit()
+            last_height = blocks_rows[-1].height
+            n_rows += len(mappings)
+        finally:
+            session.close()
+
+        log.info(f'set block id of {n_rows} transactions')
+
+    if transaction_ids:
+        log.warn(f'{len(transaction_ids)} confirmed transactions are not in any block')
+
+    return n_rows
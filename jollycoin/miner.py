@@ -0,0 +1,295 @@
+from typing import Callable, Dict
+from collections import deque
+import math
+import time
+import queue
+import threading
+import multiprocessing
+
+from . import crypto
+from . import sha256_numpy
+
+
+class MinerError(Exception):
+    pass
+
+
+# reasons of rejected blocks, by phrases of coordinator messages,
+# full messages contain hashes and amounts, so they are only logged
+REJECTED_REASONS = {
+    'stale': ('block already exists', 'wrong previous block', 'difficulty does not match'),
+    'invalid_nonce': ('wrong nonce', 'wrong hash', 'block could not be verified'),
+    'invalid_transaction': (
+        'wrong transaction',
+        'wrong reward transaction',
+        'wrong merkle root',
+        'invalid transaction',
+        'invalid hash',
+        'invalid signature',
+        'double spent',
+        'not enough funds',
+    ),
+    'http_error': (),
+    'other': (),
+}
+
+
+def get_rejected_reason(message: str) -> str:
+    for reason, phrases in REJECTED_REASONS.items():
+        if any(phrase in message for phrase in phrases):
+            return reason
+
+    return 'other'
+
+
+class MinerStats:
+    '''
+    Mining telemetry: rolling hashrate, found/submitted/rejected blocks
+    and durations of phases of mining cycle.
+    It is updated from mining executor thread, so it is guarded by lock.
+    '''
+    def __init__(self, hashrate_window: float=60.0, max_phase_samples: int=1_000):
+        self.lock = threading.Lock()
+        self.hashrate_window = hashrate_window
+        self.max_phase_samples = max_phase_samples
+        self.nonces_samples = deque()
+        self.n_nonces = 0
+        self.n_blocks_found = 0
+        self.n_blocks_submitted = 0
+        self.n_blocks_rejected = 0
+        self.n_blocks_aborted = 0
+        self.rejected_reasons = {}
+        self.phases = {}
+
+
+    def add_nonces(self, n: int):
+        now = time.monotonic()
+
+        with self.lock:
+            self.n_nonces += n
+            self.nonces_samples.append((now, n))
+
+            while self.nonces_samples and self.nonces_samples[0][0] < now - self.hashrate_window:
+                self.nonces_samples.popleft()
+
+
+    def add_block_found(self):
+        with self.lock:
+            self.n_blocks_found += 1
+
+
+    def add_block_submitted(self):
+        with self.lock:
+            self.n_blocks_submitted += 1
+
+
+    def add_block_rejected(self, reason: str):
+        # keys of rejected_reasons stay fixed set
+        if reason not in REJECTED_REASONS:
+            reason = 'other'
+
+        with self.lock:
+            self.n_blocks_rejected += 1
+            self.rejected_reasons[reason] = self.rejected_reasons.get(reason, 0) + 1
+
+
+    def add_block_aborted(self):
+        with self.lock:
+            self.n_blocks_aborted += 1
+
+
+    def add_phase_time(self, phase: str, duration: float):
+        with self.lock:
+            try:
+                samples = self.phases[phase]
+            except KeyError as e:
+                samples = self.phases[phase] = deque(maxlen=self.max_phase_samples)
+
+            samples.append(duration)
+
+
+    def get_hashrate(self) -> float:
+        now = time.monotonic()
+
+        with self.lock:
+            n = sum(c for t, c in self.nonces_samples if t >= now - self.hashrate_window)
+
+        return n / self.hashrate_window
+
+
+    @classmethod
+    def _percentile(cls, samples: list, p: float) -> float:
+        samples = sorted(samples)
+        i = min(len(samples) - 1, int(len(samples) * p))
+        return samples[i]
+
+
+    def to_dict(self) -> Dict:
+        hashrate = self.get_hashrate()
+
+        with self.lock:
+            phases = {
+                phase: {
+                    'n': len(samples),
+                    'last': samples[-1],
+                    'p50': self._percentile(samples, 0.50),
+                    'p99': self._percentile(samples, 0.99),
+                }
+                for phase, samples in self.phases.items()
+            }
+
+            return {
+                'hashrate': hashrate,
+                'hashrate_window': self.hashrate_window,
+                'n_nonces': self.n_nonces,
+                'n_blocks_found': self.n_blocks_found,
+                'n_blocks_submitted': self.n_blocks_submitted,
+                'n_blocks_rejected': self.n_blocks_rejected,
+                'n_blocks_aborted': self.n_blocks_aborted,
+                'rejected_reasons': dict(self.rejected_reasons),
+                'phases': phases,
+            }
+
+
+# process-wide mining stats, fed by nonce search and node's mining loop
+stats = MinerStats()
+
+
+def nonce_to_bytes(nonce: int) -> bytes:
+    byte_length = int(math.ceil(nonce.bit_length() / 8))
+    n = nonce.to_bytes(byte_length, byteorder='big')
+    return n
+
+
+class ScalarNonceSearch:
+    '''
+    Searches nonces for fixed message prefix and difficulty,
+    one hash at a time, using `crypto.sha256_prefix`.
+    '''
+    def __init__(self, prefix: bytes, difficulty: int):
+        self.intdigest = crypto.sha256_prefix(prefix).intdigest
+        self.difficulty = difficulty
+
+
+    def search(self, start: int, count: int, step: int=1) -> int:
+        '''
+        Checks nonces start, start + step, ..., start + (count - 1) * step.
+        Returns smallest valid of them, or None.
+        '''
+        intdigest = self.intdigest
+        difficulty = self.difficulty
+
+        for nonce in range(start, start + count * step, step):
+            if intdigest(nonce_to_bytes(nonce)) < difficulty:
+                return nonce
+
+        return None
+
+
+def nonce_search(prefix: bytes, difficulty: int):
+    '''
+    Returns NumPy vectorized nonce search if NumPy is installed,
+    otherwise falls back to scalar one. Both find same nonces.
+    '''
+    # midstate for NumPy search is calculated in pure Python (roughly cost
+    # of few vectorized hashes per prefix byte), so use it only if expected
+    # number of hashes pays it off
+    if sha256_numpy.available and difficulty > 0 and 2 ** 256 // difficulty >= 4 * len(prefix):
+        return sha256_numpy.NonceSearch(prefix, difficulty)
+
+    return ScalarNonceSearch(prefix, difficulty)
+
+
+def _search_stripe(message: bytes,
+                   difficulty: int,
+                   start: int,
+                   step: int,
+                   iterations: int,
+                   found: multiprocessing.Event,
+                   results: multiprocessing.Queue,
+                   progress: multiprocessing.Value):
+    '''
+    Worker process: scans nonces start, start + step, start + 2 * step, ...
+    Stripes of different workers never overlap. Stops once any worker
+    has found a valid nonce.
+    '''
+    search = nonce_search(message, difficulty)
+    nonce = start
+
+    while not found.is_set():
+        n = search.search(nonce, iterations, step)
+
+        with progress.get_lock():
+            progress.value += iterations if n is None else (n - nonce) // step + 1
+
+        if n is not None:
+            results.put(n)
+            found.set()
+            return
+
+        nonce += iterations * step
+
+
+def calc_nonce(message: bytes,
+               difficulty: int,
+               workers: int,
+               iterations: int=50_000,
+               is_stale: Callable[[], bool]=None) -> int:
+    '''
+    Searches nonce for message using pool of worker processes.
+    Nonce space is split into `workers` disjoint stripes.
+    First found nonce stops all workers.
+    If `is_stale` returns True while searching, all workers are stopped
+    and None is returned.
+    '''
+    assert workers > 0
+    ctx = multiprocessing.get_context()
+    found = ctx.Event()
+    results = ctx.Queue()
+    progress = ctx.Value('Q', 0)
+    reported = 0
+
+    processes = [
+        ctx.Process(
+            target=_search_stripe,
+            args=(message, difficulty, i, workers, iterations, found, results, progress),
+            daemon=True,
+        )
+        for i in range(workers)
+    ]
+
+    for p in processes:
+        p.start()
+
+    try:
+        while True:
+            try:
+                nonce = results.get(timeout=0.25)
+                break
+            except queue.Empty:
+                n = progress.value
+                stats.add_nonces(n - reported)
+                reported = n
+
+                if is_stale is not None and is_stale():
+                    nonce = None
+                    break
+
+                if any(p.is_alive() for p in processes):
+                    continue
+
+            # all workers exited, last chance to get nonce still in queue
+            try:
+                nonce = results.get(timeout=1.0)
+                break
+            except queue.Empty:
+                raise MinerError('all mining workers exited without nonce')
+    finally:
+        found.set()
+
+        for p in processes:
+            p.join()
+
+        stats.add_nonces(progress.value - reported)
+
+    return nonce
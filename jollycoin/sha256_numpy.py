@@ -0,0 +1,213 @@
+'''
+Vectorized SHA-256 nonce search using NumPy.
+
+Block preimage is absorbed once into midstate, then thousands of nonce
+candidates are hashed per call as uint32 lane arrays, and all digests are
+compared against difficulty in one vectorized step.
+
+NumPy is optional, if it is not installed `available` is False.
+'''
+from typing import List
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+available = np is not None
+
+K = [
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+]
+
+H0 = [
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+    0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+]
+
+
+def _rotr(x: int, n: int) -> int:
+    return ((x >> n) | (x << (32 - n))) & 0xffffffff
+
+
+def compress(state: List[int], chunk: bytes) -> List[int]:
+    '''
+    Scalar SHA-256 compression of single 64 bytes chunk.
+    Used once per block template to calculate midstate.
+    '''
+    w = list(struct.unpack('>16I', chunk))
+
+    for i in range(16, 64):
+        s0 = _rotr(w[i - 15], 7) ^ _rotr(w[i - 15], 18) ^ (w[i - 15] >> 3)
+        s1 = _rotr(w[i - 2], 17) ^ _rotr(w[i - 2], 19) ^ (w[i - 2] >> 10)
+        w.append((w[i - 16] + s0 + w[i - 7] + s1) & 0xffffffff)
+
+    a, b, c, d, e, f, g, h = state
+
+    for i in range(64):
+        s1 = _rotr(e, 6) ^ _rotr(e, 11) ^ _rotr(e, 25)
+        ch = (e & f) ^ (~e & g)
+        t1 = (h + s1 + ch + K[i] + w[i]) & 0xffffffff
+        s0 = _rotr(a, 2) ^ _rotr(a, 13) ^ _rotr(a, 22)
+        maj = (a & b) ^ (a & c) ^ (b & c)
+        t2 = (s0 + maj) & 0xffffffff
+        h, g, f, e, d, c, b, a = g, f, e, (d + t1) & 0xffffffff, c, b, a, (t1 + t2) & 0xffffffff
+
+    return [(x + y) & 0xffffffff for x, y in zip(state, (a, b, c, d, e, f, g, h))]
+
+
+def midstate(prefix: bytes) -> (List[int], bytes):
+    '''
+    Compresses all complete 64 bytes chunks of prefix.
+    Returns state and remaining tail of prefix.
+    '''
+    state = list(H0)
+    n = len(prefix) // 64 * 64
+
+    for i in range(0, n, 64):
+        state = compress(state, prefix[i:i + 64])
+
+    return state, prefix[n:]
+
+
+def _vrotr(x, n: int):
+    return (x >> np.uint32(n)) | (x << np.uint32(32 - n))
+
+
+def _vcompress(state: list, w: list) -> list:
+    '''
+    Vectorized SHA-256 compression. Items of `state` and `w` are either
+    uint32 scalars (same for all lanes) or uint32 arrays (one item per lane).
+    '''
+    w = list(w)
+
+    for i in range(16, 64):
+        x = w[i - 15]
+        y = w[i - 2]
+        s0 = _vrotr(x, 7) ^ _vrotr(x, 18) ^ (x >> np.uint32(3))
+        s1 = _vrotr(y, 17) ^ _vrotr(y, 19) ^ (y >> np.uint32(10))
+        w.append(w[i - 16] + s0 + w[i - 7] + s1)
+
+    a, b, c, d, e, f, g, h = state
+
+    for i in range(64):
+        s1 = _vrotr(e, 6) ^ _vrotr(e, 11) ^ _vrotr(e, 25)
+        ch = (e & f) ^ (~e & g)
+        t1 = h + s1 + ch + np.uint32(K[i]) + w[i]
+        s0 = _vrotr(a, 2) ^ _vrotr(a, 13) ^ _vrotr(a, 22)
+        maj = (a & b) ^ (a & c) ^ (b & c)
+        h, g, f, e, d, c, b, a = g, f, e, d + t1, c, b, a, t1 + s0 + maj
+
+    return [x + y for x, y in zip(state, (a, b, c, d, e, f, g, h))]
+
+
+class NonceSearch:
+    '''
+    Searches nonces for fixed message prefix and difficulty.
+    Nonce is appended to prefix as minimal big-endian bytes,
+    same as `Block.verify_nonce` expects.
+    '''
+    def __init__(self, prefix: bytes, difficulty: int, lanes: int=16_384):
+        assert available
+        self.prefix_length = len(prefix)
+        self.state, self.tail = midstate(prefix)
+        self.state = [np.uint32(x) for x in self.state]
+        self.difficulty = difficulty
+        self.lanes = lanes
+
+        # difficulty as 8 big-endian words, larger than any digest if it overflows 256 bits
+        if difficulty >= 2 ** 256:
+            self.difficulty_words = None
+        else:
+            self.difficulty_words = struct.unpack('>8I', difficulty.to_bytes(32, byteorder='big'))
+
+
+    def _final_chunks(self, nonce_length: int) -> (bytes, int):
+        # tail of prefix + nonce (zeroed) + padding + message bit length
+        message_length = self.prefix_length + nonce_length
+        n = len(self.tail) + nonce_length + 1 + 8
+        n = (n + 63) // 64 * 64
+        chunks = bytearray(n)
+        chunks[:len(self.tail)] = self.tail
+        chunks[len(self.tail) + nonce_length] = 0x80
+        chunks[-8:] = (message_length * 8).to_bytes(8, byteorder='big')
+        return bytes(chunks), len(self.tail)
+
+
+    def _hash_lanes(self, nonces, nonce_length: int) -> list:
+        chunks, offset = self._final_chunks(nonce_length)
+        words = list(struct.unpack(f'>{len(chunks) // 4}I', chunks))
+        words = [np.uint32(x) for x in words]
+
+        # place nonce bytes into words they fall in
+        for k in range(nonce_length):
+            pos = offset + k
+            shift = 8 * (nonce_length - 1 - k)
+            b = ((nonces >> np.uint64(shift)) & np.uint64(0xff)).astype(np.uint32)
+            words[pos // 4] = words[pos // 4] | (b << np.uint32(8 * (3 - pos % 4)))
+
+        state = self.state
+
+        # uint32 additions are expected to wrap around
+        with np.errstate(over='ignore'):
+            for i in range(0, len(words), 16):
+                state = _vcompress(state, words[i:i + 16])
+
+        return state
+
+
+    def _below_difficulty(self, digest: list, n: int):
+        if self.difficulty_words is None:
+            return np.ones(n, dtype=bool)
+
+        below = np.zeros(n, dtype=bool)
+        equal = np.ones(n, dtype=bool)
+
+        for x, d in zip(digest, self.difficulty_words):
+            x = np.broadcast_to(x, (n,))
+            d = np.uint32(d)
+            below |= equal & (x < d)
+            equal &= (x == d)
+
+        return below
+
+
+    def search(self, start: int, count: int, step: int=1) -> int:
+        '''
+        Checks nonces start, start + step, ..., start + (count - 1) * step.
+        Returns smallest valid of them, or None.
+        '''
+        if self.difficulty <= 0:
+            return None
+
+        end = start + count * step
+        nonce = start
+
+        while nonce < end:
+            # all nonces in one call must be of the same byte length
+            nonce_length = (nonce.bit_length() + 7) // 8
+            limit = min(end, 256 ** nonce_length, 2 ** 64)
+            n = min(self.lanes, (limit - nonce + step - 1) // step)
+
+            if n <= 0:
+                raise OverflowError('nonce does not fit in 64 bits')
+
+            nonces = np.uint64(nonce) + np.arange(n, dtype=np.uint64) * np.uint64(step)
+            digest = self._hash_lanes(nonces, nonce_length)
+            below = self._below_difficulty(digest, n)
+
+            if below.any():
+                return nonce + int(np.argmax(below)) * step
+
+            nonce += n * step
+
+        return None
@@ -1,11 +1,15 @@
-from typing import TypeVar, Dict
+from typing import TypeVar, Dict, List, Tuple
 from decimal import Decimal
 from datetime import datetime
 from collections import OrderedDict
 import json
 import random
+import operator
+import threading
 
 from . import crypto
+from . import wire
+from . import codec
 
 
 # we require it defined like this because of python3.6
@@ -17,7 +21,81 @@ class TransactionError(Exception):
     pass
 
 
+class VerifiedCache:
+    '''
+    Bounded LRU set of (hash, signature, public_key) of transactions
+    which signatures are already proven valid.
+    Hash covers all other fields, so hit means transaction is verified.
+    '''
+    def __init__(self, max_size: int=100_000):
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def contains(self, key: Tuple[str, str, str]) -> bool:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            return False
+
+
+    def add(self, key: Tuple[str, str, str]):
+        with self.lock:
+            self.entries[key] = True
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+    def get_info(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+                'max_size': self.max_size,
+            }
+
+
+# process-wide cache of verified transactions
+verified_cache = VerifiedCache()
+
+
 class Transaction:
+    # NOTE: slots instead of per instance dict, sync materializes
+    #       huge numbers of transactions at once
+    __slots__ = (
+        'version',
+        'id',
+        'time',
+        'sender_address',
+        'recipient_address',
+        'sender_public_key',
+        'amount',
+        'fee',
+        'signature',
+        'hash',
+        # cached canonical preimages, see `_get_cache`
+        '_cache',
+    )
+
+
     def __init__(self: Transaction,
                  version: str,
                  id_: str,
@@ -41,6 +119,7 @@ class Transaction:
         self.fee = None if fee is None else int(fee)
         self.signature = signature
         self.hash = hash_
+        self._cache = None
 
         if check:
             if not self.verify_hash():
@@ -50,6 +129,33 @@ class Transaction:
                 raise TransactionError('invalid signature')
 
 
+    def _get_cache(self: Transaction) -> Dict:
+        '''
+        Returns cache of canonical preimages. Cache is kept together with
+        fields it was built from, and it is dropped once any of them is
+        replaced (compared by identity, so e.g. 1 and 1.0 are different).
+        Hash is not part of preimages, so it is not compared.
+        '''
+        fields = (
+            self.version,
+            self.id,
+            self.time,
+            self.sender_address,
+            self.recipient_address,
+            self.sender_public_key,
+            self.amount,
+            self.fee,
+            self.signature,
+        )
+
+        cache = self._cache
+
+        if cache is None or any(map(operator.is_not, cache[0], fields)):
+            cache = self._cache = (fields, {})
+
+        return cache[1]
+
+
     @classmethod
     def gen_random_id(cls) -> str:
         r = random.randint(0, 2 ** 256)
@@ -101,8 +207,20 @@ class Transaction:
 
 
     def serialize(self: Transaction) -> str:
-        data = self.to_dict()
-        message = json.dumps(data)
+        cache = self._get_cache()
+
+        try:
+            hash_, message = cache['message']
+
+            if hash_ is self.hash:
+                return message
+        except KeyError as e:
+            pass
+
+        # same as json.dumps(self.to_dict()), derived from hash preimage
+        message = self.get_hash_message()
+        message = f'{message[:-1]}, "hash": {json.dumps(self.hash)}}}'
+        cache['message'] = (self.hash, message)
         return message
 
 
@@ -113,6 +231,26 @@ class Transaction:
         return tx
 
 
+    def serialize_wire(self: Transaction) -> bytes:
+        '''
+        Serializes into compact binary wire format, see `wire` module.
+        '''
+        data = self.to_dict()
+        message = wire.encode_transactions([data])
+        return message
+
+
+    @classmethod
+    def deserialize_wire(cls: type, message: bytes, check: bool=True) -> Transaction:
+        data = wire.decode_transactions(message)
+
+        if len(data) != 1:
+            raise TransactionError('expected single transaction')
+
+        tx = Transaction.from_dict(data[0], check=check)
+        return tx
+
+
     def verify(self: Transaction) -> bool:
         if not self.verify_hash():
             return False
@@ -123,7 +261,49 @@ class Transaction:
         return True
 
 
-    def verify_signature(self: Transaction) -> bool:
+    @classmethod
+    def verify_many(cls: type, transactions: List[Transaction]) -> List[bool]:
+        '''
+        Verifies hashes and signatures of many transactions,
+        signatures are verified in batch using `crypto.verify_many`.
+        Returns verified flag per transaction.
+        '''
+        verified = [tx.verify_hash() for tx in transactions]
+
+        # skip transactions which signatures are already verified
+        unverified = [
+            i
+            for i, (tx, v) in enumerate(zip(transactions, verified))
+            if v and not verified_cache.contains(tx.get_verified_cache_key())
+        ]
+
+        items = [
+            (transactions[i].sender_public_key, transactions[i].signature, transactions[i].get_signing_message())
+            for i in unverified
+        ]
+
+        for i, v in zip(unverified, crypto.verify_many(items)):
+            if v:
+                verified_cache.add(transactions[i].get_verified_cache_key())
+            else:
+                verified[i] = False
+
+        return verified
+
+
+    def get_verified_cache_key(self: Transaction) -> Tuple[str, str, str]:
+        # NOTE: calculated hash, not claimed one
+        return (self.calc_hash(), self.signature, self.sender_public_key)
+
+
+    def get_signing_message(self: Transaction) -> str:
+        cache = self._get_cache()
+
+        try:
+            return cache['signing_message']
+        except KeyError as e:
+            pass
+
         data = OrderedDict([
             ['version', self.version],
             ['id', self.id],
@@ -137,52 +317,66 @@ class Transaction:
             # without hash
         ])
 
-        message = json.dumps(data)
+        message = codec.dumps_canonical(data)
+        cache['signing_message'] = message
+        return message
+
+
+    def verify_signature(self: Transaction) -> bool:
+        key = self.get_verified_cache_key()
+
+        if verified_cache.contains(key):
+            return True
+
+        message = self.get_signing_message()
         
-        return crypto.verify_message(self.sender_public_key,
-                                     self.signature,
-                                     message)
+        verified = crypto.verify_message(self.sender_public_key,
+                                         self.signature,
+                                         message)
+
+        if verified:
+            verified_cache.add(key)
+
+        return verified
 
 
     def verify_hash(self: Transaction) -> bool:
         return self.hash == self.calc_hash()
 
 
+    def get_hash_message(self: Transaction) -> str:
+        cache = self._get_cache()
+
+        try:
+            return cache['hash_message']
+        except KeyError as e:
+            pass
+
+        # same as canonical JSON of all fields without hash,
+        # derived from signing preimage
+        message = self.get_signing_message()
+        message = f'{message[:-1]}, "signature": {codec.dumps_canonical(self.signature)}}}'
+        cache['hash_message'] = message
+        return message
+
+
     def calc_hash(self: Transaction) -> str:
-        data = OrderedDict([
-            ['version', self.version],
-            ['id', self.id],
-            ['time', self.time],
-            ['sender_address', self.sender_address],
-            ['recipient_address', self.recipient_address],
-            ['sender_public_key', self.sender_public_key],
-            ['amount', self.amount],
-            ['fee', self.fee],
-            ['signature', self.signature],
-            # without hash
-        ])
+        cache = self._get_cache()
+
+        try:
+            return cache['hash']
+        except KeyError as e:
+            pass
 
-        message = json.dumps(data)
+        message = self.get_hash_message()
         message_bytes = message.encode()
         hash_ = crypto.sha256(message_bytes).hexdigest()
+        cache['hash'] = hash_
         return hash_
 
 
     def sign(self: Transaction, private_key: str) -> str:
-        data = OrderedDict([
-            ['version', self.version],
-            ['id', self.id],
-            ['time', self.time],
-            ['sender_address', self.sender_address],
-            ['recipient_address', self.recipient_address],
-            ['sender_public_key', self.sender_public_key],
-            ['amount', self.amount],
-            ['fee', self.fee],
-            # without signature
-            # without hash
-        ])
-
-        message = json.dumps(data)
+        message = self.get_signing_message()
         signature = crypto.sign_message(private_key, message)
         self.signature = signature
         self.hash = self.calc_hash()
@@ -239,5 +433,63 @@ def test2():
     print(tx1.verify_signature())
 
 
+def test_golden():
+    # canonical preimages must stay byte for byte same as before caching
+    golden = [
+        (
+            ['00' * 32, '2018-06-01T12:00:00.000000', None, 'J' + 'ab' * 32, None, 795920000000, 0, None],
+            'adeb2201bb3f9525e568b129633e9c3ba408e3d1194a0642987d47ea6a22fe6a',
+            'fcd7cd19aa557aacd69f836e27f10b5f0410fb988525751e30ec8206237441ca',
+        ),
+        (
+            ['5d' * 32, '2019-01-02T03:04:05.678901', 'J' + '12' * 32, 'J' + '34' * 32, '04' + 'cd' * 64, 1_000_000_000, 1_000, '30' + '45' * 70],
+            '1929a59e111929163c4e8e0995a603090e0f0082c66aa045f35f0b944c6c2d95',
+            'c493f865a9f7014458d85700d64595c66e477c24afc11c5dba6547083b789317',
+        ),
+        (
+            ['ff' * 32, '2019-01-02T03:04:05', 'J' + '9e' * 32, 'J' + '01' * 32, '04' + '77' * 64, 0, 10 ** 30, '3044'],
+            'e28319d30373eeabbdb65009eab1e01f83b21fddf1de2d4e50e3df0ca00a8b97',
+            '20fad19ada55e40e884ac2cc130527026d67698380d1216f45018b87e060ff12',
+        ),
+        (
+            ['a1' * 32, '2019-13-45Tünicode"quote\\', 'J' + '9e' * 32, 'J' + '01' * 32, '04' + '77' * 64, -5, 1000, '3046'],
+            '91d9d4087741bc8d12eebba9ad2bcdb89459fd3dec595c84af9b4b18562437d4',
+            'b25aa32682903065384acbd0e943d2e859993a232bde693d411387edba3ed581',
+        ),
+    ]
+
+    for fields, hash_, signing_hash in golden:
+        id_, time_, sender_address, recipient_address, sender_public_key, amount, fee, signature = fields
+
+        tx = Transaction(
+            version='1.0',
+            id_=id_,
+            time_=time_,
+            sender_address=sender_address,
+            recipient_address=recipient_address,
+            sender_public_key=sender_public_key,
+            amount=amount,
+            fee=fee,
+            signature=signature,
+            hash_=None,
+            check=False,
+        )
+
+        # twice, second time from cache
+        for i in range(2):
+            assert tx.calc_hash() == hash_
+            assert crypto.sha256(tx.get_signing_message().encode()).hexdigest() == signing_hash
+
+        # changing any field must invalidate cached preimages
+        tx.fee += 1
+        assert tx.calc_hash() != hash_
+        assert crypto.sha256(tx.get_signing_message().encode()).hexdigest() != signing_hash
+        tx.fee -= 1
+        assert tx.calc_hash() == hash_
+
+    print('golden ok')
+
+
 if __name__ == '__main__':
+    test_golden()
     test2()
@@ -0,0 +1,355 @@
+'''
+Compact binary wire format for blocks and transactions.
+
+Hashes, ids, public keys and signatures are carried as raw bytes instead
+of hex strings, integers as minimal big-endian bytes. Every value is
+tagged with its type, so values which do not look like hex (e.g. time,
+version, or any malformed input) are carried as they are, and decoding
+gives back exactly the same values as JSON would. That keeps hashes and
+signatures of decoded blocks and transactions verifiable.
+
+Values are stored by columns (field by field), so whole column of hashes
+is converted to hex at once, which makes decoding cheaper than parsing JSON.
+
+Layout:
+    message := MAGIC kind n_rows column* [n_transactions column*]
+    column  := width tags[n_rows] lengths[n_rows] payload_length payload
+'''
+from typing import List, Dict, Tuple
+from itertools import accumulate
+import struct
+
+
+CONTENT_TYPE = 'application/x-jollycoin'
+MAGIC = b'JLC\x01'
+
+# message kinds
+KIND_BLOCKS = 1
+KIND_TRANSACTIONS = 2
+
+# value tags
+T_NONE = 0
+T_HEX = 1       # lowercase hex string, as raw bytes
+T_ADDRESS = 2   # 'J' + lowercase hex string, as raw bytes
+T_STR = 3       # any other string, utf-8
+T_INT = 4       # non-negative integer, minimal big-endian bytes
+T_NEG_INT = 5   # negative integer, magnitude as minimal big-endian bytes
+
+_u8 = struct.Struct('>B')
+_u32 = struct.Struct('>I')
+
+BLOCK_FIELDS = (
+    'version',
+    'height',
+    'id',
+    'prev_hash',
+    'time',
+    'merkle_root',
+    'difficulty',
+    'nonce',
+    'hash',
+)
+
+TRANSACTION_FIELDS = (
+    'version',
+    'id',
+    'time',
+    'sender_address',
+    'recipient_address',
+    'sender_public_key',
+    'amount',
+    'fee',
+    'signature',
+    'hash',
+)
+
+
+class WireError(Exception):
+    pass
+
+
+def _is_hex(s: str) -> bool:
+    if not s or len(s) % 2:
+        return False
+
+    try:
+        return bytes.fromhex(s).hex() == s
+    except ValueError as e:
+        return False
+
+
+def _is_ascii(b: bytes) -> bool:
+    # NOTE: bytes.isascii is not available in python3.6
+    try:
+        b.decode('ascii')
+        return True
+    except UnicodeDecodeError as e:
+        return False
+
+
+def _int_to_bytes(n: int) -> bytes:
+    return n.to_bytes((n.bit_length() + 7) // 8, byteorder='big')
+
+
+def encode_value(value) -> Tuple[int, bytes]:
+    '''
+    Returns tag and payload of value.
+    '''
+    if value is None:
+        return T_NONE, b''
+    elif isinstance(value, str):
+        if _is_hex(value):
+            return T_HEX, bytes.fromhex(value)
+        elif value[:1] == 'J' and _is_hex(value[1:]):
+            return T_ADDRESS, bytes.fromhex(value[1:])
+        else:
+            return T_STR, value.encode()
+    elif isinstance(value, int) and not isinstance(value, bool):
+        if value >= 0:
+            return T_INT, _int_to_bytes(value)
+        else:
+            return T_NEG_INT, _int_to_bytes(-value)
+
+    raise WireError(f'unsupported value {value!r}')
+
+
+def decode_value(tag: int, b: bytes):
+    if tag == T_NONE:
+        return None
+    elif tag == T_HEX:
+        return b.hex()
+    elif tag == T_ADDRESS:
+        return 'J' + b.hex()
+    elif tag == T_STR:
+        try:
+            return b.decode()
+        except UnicodeDecodeError as e:
+            raise WireError('invalid string')
+    elif tag == T_INT:
+        return int.from_bytes(b, byteorder='big')
+    elif tag == T_NEG_INT:
+        return -int.from_bytes(b, byteorder='big')
+
+    raise WireError(f'unknown tag {tag!r}')
+
+
+def _encode_column(out: bytearray, values: list):
+    tags = bytearray()
+    lengths = []
+    payload = bytearray()
+
+    for value in values:
+        tag, b = encode_value(value)
+        tags.append(tag)
+        lengths.append(len(b))
+        payload += b
+
+    if max(lengths, default=0) <= 0xff:
+        out += _u8.pack(1)
+        out += tags
+        out += bytes(lengths)
+    else:
+        out += _u8.pack(4)
+        out += tags
+        out += struct.pack(f'>{len(lengths)}I', *lengths)
+
+    out += _u32.pack(len(payload))
+    out += payload
+
+
+def _decode_column(data: bytes, offset: int, n: int) -> Tuple[list, int]:
+    try:
+        width = data[offset]
+        offset += 1
+        tags = data[offset:offset + n]
+        offset += n
+
+        if width == 1:
+            lengths = data[offset:offset + n]
+            offset += n
+        elif width == 4:
+            lengths = struct.unpack_from(f'>{n}I', data, offset)
+            offset += 4 * n
+        else:
+            raise WireError(f'unknown column width {width!r}')
+
+        size, = _u32.unpack_from(data, offset)
+        offset += 4
+    except IndexError as e:
+        raise WireError('truncated message')
+    except struct.error as e:
+        raise WireError('truncated message')
+
+    payload = data[offset:offset + size]
+    offset += size
+
+    if len(tags) != n or len(lengths) != n or len(payload) != size or sum(lengths) != size:
+        raise WireError('truncated message')
+
+    column_tags = set(tags)
+
+    # hashes and ids, whole column of same type and length
+    if n and len(column_tags) == 1 and lengths.count(lengths[0]) == n and tags[0] in (T_HEX, T_ADDRESS):
+        h = payload.hex()
+        m = 2 * lengths[0]
+        values = [h[i:i + m] for i in range(0, len(h), m)]
+
+        if tags[0] == T_ADDRESS:
+            values = ['J' + v for v in values]
+
+        return values, offset
+
+    ends = list(accumulate(lengths))
+    starts = [0] + ends[:-1]
+
+    # common cases, whole column of same type, optionally with None values
+    if column_tags <= {T_NONE, T_HEX}:
+        h = payload.hex()
+        values = [h[2 * a:2 * b] if tag else None for tag, a, b in zip(tags, starts, ends)]
+    elif column_tags <= {T_NONE, T_ADDRESS}:
+        h = payload.hex()
+        values = ['J' + h[2 * a:2 * b] if tag else None for tag, a, b in zip(tags, starts, ends)]
+    elif column_tags == {T_INT}:
+        values = [int.from_bytes(payload[a:b], byteorder='big') for a, b in zip(starts, ends)]
+    elif column_tags == {T_STR} and _is_ascii(payload):
+        # byte offsets are same as character offsets
+        text = payload.decode('ascii')
+        values = [text[a:b] for a, b in zip(starts, ends)]
+    else:
+        values = [decode_value(tag, payload[a:b]) for tag, a, b in zip(tags, starts, ends)]
+
+    return values, offset
+
+
+def _decode_count(data: bytes, offset: int) -> Tuple[int, int]:
+    try:
+        n, = _u32.unpack_from(data, offset)
+    except struct.error as e:
+        raise WireError('truncated message')
+
+    return n, offset + 4
+
+
+def _encode_rows(out: bytearray, rows: List[Dict], fields: Tuple[str]):
+    out += _u32.pack(len(rows))
+
+    for k in fields:
+        _encode_column(out, [row[k] for row in rows])
+
+
+def _decode_rows(data: bytes, offset: int, fields: Tuple[str]) -> Tuple[List[Dict], int]:
+    n, offset = _decode_count(data, offset)
+    columns = []
+
+    for k in fields:
+        values, offset = _decode_column(data, offset, n)
+        columns.append(values)
+
+    rows = [dict(zip(fields, values)) for values in zip(*columns)]
+    return rows, offset
+
+
+def _decode_header(data: bytes, kind: int) -> int:
+    if data[:len(MAGIC)] != MAGIC:
+        raise WireError('not a wire message')
+
+    offset = len(MAGIC)
+
+    if data[offset:offset + 1] != _u8.pack(kind):
+        raise WireError('unexpected message kind')
+
+    return offset + 1
+
+
+def encode_blocks(blocks_data: List[Dict]) -> bytes:
+    '''
+    Encodes blocks given as dicts, same as `Block.to_dict` returns.
+    '''
+    out = bytearray(MAGIC)
+    out += _u8.pack(KIND_BLOCKS)
+    _encode_rows(out, blocks_data, BLOCK_FIELDS)
+    _encode_column(out, [len(block_data['transactions']) for block_data in blocks_data])
+    transactions_data = [tx_data for block_data in blocks_data for tx_data in block_data['transactions']]
+    _encode_rows(out, transactions_data, TRANSACTION_FIELDS)
+    return bytes(out)
+
+
+def decode_blocks(data: bytes) -> List[Dict]:
+    '''
+    Decodes blocks into dicts, same as `Block.from_dict_many` expects.
+    '''
+    offset = _decode_header(data, KIND_BLOCKS)
+    blocks_data, offset = _decode_rows(data, offset, BLOCK_FIELDS)
+    n_transactions, offset = _decode_column(data, offset, len(blocks_data))
+    transactions_data, offset = _decode_rows(data, offset, TRANSACTION_FIELDS)
+
+    if offset != len(data):
+        raise WireError('trailing bytes')
+
+    if any(not isinstance(n, int) or n < 0 for n in n_transactions) or sum(n_transactions) != len(transactions_data):
+        raise WireError('wrong number of transactions')
+
+    i = 0
+
+    for block_data, n in zip(blocks_data, n_transactions):
+        block_data['transactions'] = transactions_data[i:i + n]
+        i += n
+
+    return blocks_data
+
+
+def encode_block(block_data: Dict) -> bytes:
+    return encode_blocks([block_data])
+
+
+def decode_block(data: bytes) -> Dict:
+    blocks_data = decode_blocks(data)
+
+    if len(blocks_data) != 1:
+        raise WireError('expected single block')
+
+    return blocks_data[0]
+
+
+def encode_transactions(transactions_data: List[Dict]) -> bytes:
+    out = bytearray(MAGIC)
+    out += _u8.pack(KIND_TRANSACTIONS)
+    _encode_rows(out, transactions_data, TRANSACTION_FIELDS)
+    return bytes(out)
+
+
+def decode_transactions(data: bytes) -> List[Dict]:
+    offset = _decode_header(data, KIND_TRANSACTIONS)
+    transactions_data, offset = _decode_rows(data, offset, TRANSACTION_FIELDS)
+
+    if offset != len(data):
+        raise WireError('trailing bytes')
+
+    return transactions_data
+
+
+def accepts(accept: str) -> bool:
+    '''
+    Returns True if HTTP `Accept` header value accepts binary wire format.
+    '''
+    if not accept:
+        return False
+
+    for media_range in accept.split(','):
+        media_type, *params = media_range.split(';')
+
+        if media_type.strip().lower() != CONTENT_TYPE:
+            continue
+
+        for param in params:
+            k, _, v = param.partition('=')
+
+            if k.strip() == 'q':
+                try:
+                    return float(v) > 0
+                except ValueError as e:
+                    return False
+
+        return True
+
+    return False
@@ -1,14 +1,16 @@
 __version__ = '1.0.4'
 
 import os
+import time
 import json
 import random
 import asyncio
 import hashlib
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 # from contextlib import contextmanager, asynccontextmanager
 
-from aiohttp import web, ClientSession
+from aiohttp import web, ClientSession, ClientError
 import aiohttp_cors
 import requests
 
@@ -25,7 +27,18 @@ parser.add_argument('--coordinator', type=str, default=Config.COORDINATOR, help=
 parser.add_argument('--no-sync', action='store_true')
 parser.add_argument('--no-mine', action='store_true')
 parser.add_argument('--generate-genesis-block', action='store_true')
+parser.add_argument('--migrate-v1-tables', action='store_true', help='Copy rows of v1 tables, with integers stored as strings, to v2 tables, needed once for existing databases')
+parser.add_argument('--rebuild-volume-rollups', action='store_true', help='Build volume rollup tables from all confirmed transactions, needed once for existing databases')
+parser.add_argument('--check-volume-rollups', action='store_true', help='Compare volumes from rollup tables to volumes from transactions')
+parser.add_argument('--rebuild-address-balances', action='store_true', help='Build address balance table from all confirmed transactions, needed once for existing databases')
+parser.add_argument('--check-address-balances', action='store_true', help='Compare address balance table to confirmed transactions')
+parser.add_argument('--rebuild-chain-counters', action='store_true', help='Build chain counters by counting blocks and transactions, needed once for existing databases')
+parser.add_argument('--check-chain-counters', action='store_true', help='Compare chain counters to counts of blocks and transactions')
 parser.add_argument('--miner-address', default=Config.MINER_ADDRESS, help='Miner address')
+parser.add_argument('--miner-workers', type=int, default=Config.MINER_WORKERS, help='Number of mining worker processes, 0 mines in executor thread of node process')
+parser.add_argument('--verify-workers', type=int, default=Config.VERIFY_WORKERS, help='Number of signature verification worker processes, defaults to number of CPUs')
+parser.add_argument('--address-info-limit', type=int, default=Config.ADDRESS_INFO_LIMIT, help='Max number of confirmed and unconfirmed transactions per page of address info')
+parser.add_argument('--wire-format', choices=['json', 'binary'], default=Config.WIRE_FORMAT, help='Format of blocks requested from and submitted to coordinator')
 args = parser.parse_args()
 
 # update config
@@ -36,14 +49,30 @@ Config.COORDINATOR = args.coordinator
 Config.NO_SYNC = args.no_sync
 Config.NO_MINE = args.no_mine
 Config.GENERATE_GENESIS_BLOCK = args.generate_genesis_block
+Config.MIGRATE_V1_TABLES = args.migrate_v1_tables
+Config.REBUILD_VOLUME_ROLLUPS = args.rebuild_volume_rollups
+Config.CHECK_VOLUME_ROLLUPS = args.check_volume_rollups
+Config.REBUILD_ADDRESS_BALANCES = args.rebuild_address_balances
+Config.CHECK_ADDRESS_BALANCES = args.check_address_balances
+Config.REBUILD_CHAIN_COUNTERS = args.rebuild_chain_counters
+Config.CHECK_CHAIN_COUNTERS = args.check_chain_counters
 Config.MINER_ADDRESS = args.miner_address
+Config.MINER_WORKERS = args.miner_workers
+Config.VERIFY_WORKERS = args.verify_workers
+Config.WIRE_FORMAT = args.wire_format
+Config.ADDRESS_INFO_LIMIT = args.address_info_limit
 
 
 from jollycoin.db import Session, BlockModel, TransactionModel
 from jollycoin.blockchain import Blockchain, BlockchainError
 from jollycoin.block import Block, BlockError
 from jollycoin.transaction import Transaction, TransactionError
+from jollycoin.merkle import MerkleAccumulator
 from jollycoin import crypto
+from jollycoin import miner
+from jollycoin import wire
+from jollycoin import codec
+from jollycoin import migrate
 
 
 # blockchain
@@ -61,6 +90,19 @@ Lock = asyncio.Lock
 
 session_lock = Lock()
 
+# mining runs in executor thread so event loop keeps serving requests,
+# thread itself only waits for mining worker processes
+mining_executor = ThreadPoolExecutor(max_workers=1)
+
+# seconds after which mining is interrupted, so block template picks up
+# transactions which showed up in mempool meanwhile
+TEMPLATE_REFRESH_INTERVAL = 30.0
+
+
+def json_response(data: dict, status: int=200) -> web.Response:
+    # encoded by fast json codec if it is installed
+    return web.Response(body=codec.dumps(data), status=status, content_type='application/json')
+
 
 #
 # stats
@@ -98,7 +140,7 @@ async def v1_stats(request):
                 'message': 'system error',
             }
 
-            return web.json_response(response)
+            return json_response(response)
         finally:
             session.close()
 
@@ -118,7 +160,7 @@ async def v1_stats(request):
         'monthly_volume': monthly_volume,
     }
 
-    return web.json_response(response)
+    return json_response(response)
 
 
 #
@@ -128,10 +170,10 @@ async def v1_stats(request):
 async def v1_difficulty(request):
     response = {
         'status': 'success',
-        'difficulty': blockchain.difficulty,
+        'difficulty': codec.wide_int(blockchain.difficulty),
     }
 
-    return web.json_response(response)
+    return json_response(response)
 
 
 #
@@ -144,7 +186,7 @@ async def v1_reward(request):
         'reward': blockchain.reward_amount,
     }
 
-    return web.json_response(response)
+    return json_response(response)
 
 
 #
@@ -157,7 +199,7 @@ async def v1_fee(request):
         'fee': blockchain.fee_amount,
     }
 
-    return web.json_response(response)
+    return json_response(response)
 
 
 #
@@ -168,19 +210,44 @@ async def v1_get_address_info(request):
     data = await request.json()
     address = data['address']
 
+    # totals only, without transactions
+    summary = data.get('summary', False)
+
+    # pages of transactions, oldest first
+    limit = data.get('limit', Config.ADDRESS_INFO_LIMIT)
+    confirmed_cursor = data.get('confirmed_cursor')
+    unconfirmed_cursor = data.get('unconfirmed_cursor')
+
+    if not isinstance(summary, bool):
+        response = {'status': 'error', 'message': 'summary must be true or false'}
+        return json_response(response, status=400)
+
+    if type(limit) is not int or not 0 < limit <= Config.ADDRESS_INFO_LIMIT:
+        response = {'status': 'error', 'message': f'limit must be between 1 and {Config.ADDRESS_INFO_LIMIT}'}
+        return json_response(response, status=400)
+
     async with session_lock:
         session = Session()
         
         try:
-            address_info = blockchain.get_address_info(session, address, check=False)
+            address_info = blockchain.get_address_info(
+                session,
+                address,
+                check=False,
+                return_confirmed_transactions=not summary,
+                return_unconfirmed_transactions=not summary,
+                limit=limit,
+                confirmed_cursor=confirmed_cursor,
+                unconfirmed_cursor=unconfirmed_cursor,
+            )
         except BlockchainError as e:
             log.error(f'v1_get_address_info error [0]: {e!r}')
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except Exception as e:
             log.error(f'v1_get_address_info error [1]: {e!r}')
             response = {'status': 'error', 'message': 'system error'}
-            return web.json_response(response)
+            return json_response(response)
         finally:
             session.close()
             session = None
@@ -188,11 +255,20 @@ async def v1_get_address_info(request):
     response = {
         'status': 'success',
         'address': address_info['address'],
-        'n_confirmed_transactions': len(address_info['confirmed_transactions']),
-        'n_unconfirmed_transactions': len(address_info['unconfirmed_transactions']),
-        'confirmed_transactions': [tx.to_dict() for tx in address_info['confirmed_transactions']],
-        'unconfirmed_transactions': [tx.to_dict() for tx in address_info['unconfirmed_transactions']],
-        
+    }
+
+    if not summary:
+        response.update({
+            'confirmed_transactions': [tx.to_dict() for tx in address_info['confirmed_transactions']],
+            'unconfirmed_transactions': [tx.to_dict() for tx in address_info['unconfirmed_transactions']],
+            'next_confirmed_cursor': address_info['next_confirmed_cursor'],
+            'next_unconfirmed_cursor': address_info['next_unconfirmed_cursor'],
+        })
+
+    response.update({
+        'n_confirmed_transactions': address_info['n_confirmed_transactions'],
+        'n_unconfirmed_transactions': address_info['n_unconfirmed_transactions'],
+
         'confirmed_total_received': address_info['confirmed_total_received'],
         'confirmed_total_sent': address_info['confirmed_total_sent'],
         'confirmed_total_fee': address_info['confirmed_total_fee'],
@@ -207,9 +283,9 @@ async def v1_get_address_info(request):
         'total_sent': address_info['total_sent'],
         'total_fee': address_info['total_fee'],
         'balance': address_info['balance'],
-    }
+    })
 
-    return web.json_response(response)
+    return json_response(response)
 
 
 #
@@ -229,11 +305,11 @@ async def v1_transaction_get(request):
         except BlockchainError as e:
             log.error(f'v1_transaction_get error [0]: {e!r}')
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except Exception as e:
             log.error(f'v1_transaction_get error [1]: {e!r}')
             response = {'status': 'error', 'message': 'system error'}
-            return web.json_response(response)
+            return json_response(response)
         finally:
             session.close()
 
@@ -242,7 +318,36 @@ async def v1_transaction_get(request):
         'transaction': transaction,
     }
 
-    return web.json_response(response)
+    return json_response(response)
+
+
+@routes.post('/v1/transaction/proof')
+async def v1_transaction_proof(request):
+    data = await request.json()
+    transaction_id = data['transaction_id']
+
+    async with session_lock:
+        session = Session()
+
+        try:
+            proof = blockchain.get_transaction_proof(session, transaction_id)
+        except BlockchainError as e:
+            log.error(f'v1_transaction_proof error [0]: {e!r}')
+            response = {'status': 'error', 'message': str(e)}
+            return json_response(response)
+        except Exception as e:
+            log.error(f'v1_transaction_proof error [1]: {e!r}')
+            response = {'status': 'error', 'message': 'system error'}
+            return json_response(response)
+        finally:
+            session.close()
+
+    response = {
+        'status': 'success',
+        **proof,
+    }
+
+    return json_response(response)
 
 
 @routes.post('/v1/transaction/get-range')
@@ -251,22 +356,23 @@ async def v1_transaction_get_range(request):
     start = data.get('start', 0)
     end = data.get('end', None)
     is_reversed = data.get('is_reversed', False)
+    cursor = data.get('cursor', None)
     
     async with session_lock:
         session = Session()
         
         try:    
-            transactions = blockchain.get_transactions_range(session, start, end, is_reversed)
+            transactions, next_cursor = blockchain.get_transactions_range(session, start, end, is_reversed, cursor)
             transactions = [tx.to_dict() for tx in transactions]
             n_transactions = blockchain.get_n_transactions(session)
         except BlockchainError as e:
             log.error(f'v1_transaction_get_range error [0]: {e!r}')
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except Exception as e:
             log.error(f'v1_transaction_get_range error [1]: {e!r}')
             response = {'status': 'error', 'message': 'system error'}
-            return web.json_response(response)
+            return json_response(response)
         finally:
             session.close()
 
@@ -274,9 +380,10 @@ async def v1_transaction_get_range(request):
         'status': 'success',
         'transactions': transactions,
         'n_transactions': n_transactions,
+        'next_cursor': next_cursor,
     }
 
-    return web.json_response(response)
+    return json_response(response)
 
 
 #
@@ -296,11 +403,11 @@ async def v1_unconfirmed_transaction_get(request):
         except BlockchainError as e:
             log.error(f'v1_unconfirmed_transaction_get error [0]: {e!r}')
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except Exception as e:
             log.error(f'v1_unconfirmed_transaction_get error [1]: {e!r}')
             response = {'status': 'error', 'message': 'system error'}
-            return web.json_response(response)
+            return json_response(response)
         finally:
             session.close()
 
@@ -309,7 +416,7 @@ async def v1_unconfirmed_transaction_get(request):
         'transaction': transaction,
     }
 
-    return web.json_response(response)
+    return json_response(response)
 
 
 @routes.post('/v1/unconfirmed-transaction/get-range')
@@ -318,22 +425,23 @@ async def v1_unconfirmed_transaction_get_range(request):
     start = data['start']
     end = data.get('end', None)
     is_reversed = data.get('is_reversed', False)
+    cursor = data.get('cursor', None)
 
     async with session_lock:
         session = Session()
         
         try:
-            unconfirmed_transactions = blockchain.get_unconfirmed_transactions_range(session, start, end, is_reversed)
+            unconfirmed_transactions, next_cursor = blockchain.get_unconfirmed_transactions_range(session, start, end, is_reversed, cursor)
             unconfirmed_transactions = [tx.to_dict() for tx in unconfirmed_transactions]
             n_unconfirmed_transactions = blockchain.get_n_unconfirmed_transactions(session)
         except BlockchainError as e:
             log.error(f'v1_unconfirmed_transaction_get_range error [0]: {e!r}')
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except Exception as e:
             log.error(f'v1_unconfirmed_transaction_get_range error [1]: {e!r}')
             response = {'status': 'error', 'message': 'system error'}
-            return web.json_response(response)
+            return json_response(response)
         finally:
             session.close()
 
@@ -341,27 +449,34 @@ async def v1_unconfirmed_transaction_get_range(request):
         'status': 'success',
         'unconfirmed_transactions': unconfirmed_transactions,
         'n_unconfirmed_transactions': n_unconfirmed_transactions,
+        'next_cursor': next_cursor,
     }
 
-    return web.json_response(response)
+    return json_response(response)
 
 
 @routes.post('/v1/unconfirmed-transaction/add')
 async def v1_unconfirmed_transaction_add(request):
-    data = await request.json()
-    tx_data = data['transaction']
-
-    # create transaction out of dict
+    # create transaction out of dict, or from binary wire format
     try:
-        tx = Transaction.from_dict(tx_data)
-    except TransactionError as e:
+        if request.content_type == wire.CONTENT_TYPE:
+            message = await request.read()
+            tx = Transaction.deserialize_wire(message)
+        else:
+            data = await request.json()
+            tx = Transaction.from_dict(data['transaction'])
+    except wire.WireError as e:
         log.error(f'v1_unconfirmed_transaction_add error [0]: {e!r}')
         response = {'status': 'error', 'message': str(e)}
-        return web.json_response(response)
-    except Exception as e:
+        return json_response(response)
+    except TransactionError as e:
         log.error(f'v1_unconfirmed_transaction_add error [1]: {e!r}')
+        response = {'status': 'error', 'message': str(e)}
+        return json_response(response)
+    except Exception as e:
+        log.error(f'v1_unconfirmed_transaction_add error [2]: {e!r}')
         response = {'status': 'error', 'message': 'system error'}
-        return web.json_response(response)
+        return json_response(response)
 
     # add to unconfirmed transactions
     async with session_lock:
@@ -371,20 +486,20 @@ async def v1_unconfirmed_transaction_add(request):
             blockchain.add_unconfirmed_transaction(session, tx)
             session.commit()
         except BlockchainError as e:
-            log.error(f'v1_unconfirmed_transaction_add error [2]: {e!r}')
+            log.error(f'v1_unconfirmed_transaction_add error [3]: {e!r}')
             session.rollback()
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except Exception as e:
-            log.error(f'v1_unconfirmed_transaction_add error [3]: {e!r}')
+            log.error(f'v1_unconfirmed_transaction_add error [4]: {e!r}')
             session.rollback()
             response = {'status': 'error', 'message': 'system error'}
-            return web.json_response(response)
+            return json_response(response)
         finally:
             session.close()
 
     response = {'status': 'success'}
-    return web.json_response(response)
+    return json_response(response)
 
 
 #
@@ -404,15 +519,15 @@ async def v1_block_get(request):
         except BlockError as e:
             log.error(f'v1_block_get error [0]: {e!r}')
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except BlockchainError as e:
             log.error(f'v1_block_get error [1]: {e!r}')
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except Exception as e:
             log.error(f'v1_block_get error [2]: {e!r}')
             response = {'status': 'error', 'message': 'system error'}
-            return web.json_response(response)
+            return json_response(response)
         finally:
             session.close()
 
@@ -421,7 +536,7 @@ async def v1_block_get(request):
         'block': block,
     }
 
-    return web.json_response(response)
+    return json_response(response)
 
 
 @routes.post('/v1/block/get-range')
@@ -430,56 +545,88 @@ async def v1_block_get_blocks_range(request):
     start = data.get('start', 0)
     end = data.get('end', None)
     is_reversed = data.get('is_reversed', False)
+    cursor = data.get('cursor', None)
 
     async with session_lock:
         session = Session()
 
         try:
-            blocks = blockchain.get_blocks_range(session, start, end, is_reversed)
-            blocks = [b.to_dict() for b in blocks]
+            blocks, next_cursor = blockchain.get_blocks_range(session, start, end, is_reversed, cursor)
             n_blocks = blockchain.get_n_blocks(session)
         except BlockError as e:
             log.error(f'v1_block_get_blocks_range error [0]: {e!r}')
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except BlockchainError as e:
             log.error(f'v1_block_get_blocks_range error [1]: {e!r}')
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except Exception as e:
             log.error(f'v1_block_get_blocks_range error [2]: {e!r}')
             response = {'status': 'error', 'message': 'system error'}
-            return web.json_response(response)
+            return json_response(response)
         finally:
             session.close()
 
+    # binary wire format if client accepts it, errors are always sent as json
+    if wire.accepts(request.headers.get('Accept')):
+        loop = asyncio.get_event_loop()
+        message = await loop.run_in_executor(None, Block.serialize_wire_many, blocks)
+        headers = {'X-N-Blocks': str(n_blocks)}
+
+        if next_cursor is not None:
+            headers['X-Next-Cursor'] = next_cursor
+
+        return web.Response(body=message, content_type=wire.CONTENT_TYPE, headers=headers)
+
+    blocks = [b.to_dict() for b in blocks]
+
+    # difficulty does not fit in 64 bits, see codec
+    for b in blocks:
+        b['difficulty'] = codec.wide_int(b['difficulty'])
+
     response = {
         'status': 'success',
         'blocks': blocks,
         'n_blocks': n_blocks,
+        'next_cursor': next_cursor,
     }
 
-    return web.json_response(response)
+    return json_response(response)
 
 
 @routes.post('/v1/block/add')
 async def v1_block_add(request):
     # NOTE: this is where mined blocks are submitted
-    data = await request.json()
-    block = data['block']
-    
-    # create block from dict
+    # create block from dict, or from binary wire format
+    # transactions are verified by process pool, so wait for it in executor thread
     try:
-        block = Block.from_dict(block)
+        loop = asyncio.get_event_loop()
+
+        if request.content_type == wire.CONTENT_TYPE:
+            message = await request.read()
+            block = await loop.run_in_executor(None, Block.deserialize_wire, message)
+        else:
+            data = await request.json()
+            block = await loop.run_in_executor(None, Block.from_dict, data['block'])
+
         log.warn(f'v1_block_add block: {block}')
-    except BlockError as e:
+    except wire.WireError as e:
         log.error(f'v1_block_add error [0]: {e!r}')
         response = {'status': 'error', 'message': str(e)}
-        return web.json_response(response)
-    except Exception as e:
+        return json_response(response)
+    except BlockError as e:
         log.error(f'v1_block_add error [1]: {e!r}')
+        response = {'status': 'error', 'message': str(e)}
+        return json_response(response)
+    except TransactionError as e:
+        log.error(f'v1_block_add error [2]: {e!r}')
+        response = {'status': 'error', 'message': str(e)}
+        return json_response(response)
+    except Exception as e:
+        log.error(f'v1_block_add error [3]: {e!r}')
         response = {'status': 'error', 'message': 'system error'}
-        return web.json_response(response)
+        return json_response(response)
 
     # add block
     async with session_lock:
@@ -489,21 +636,37 @@ async def v1_block_add(request):
             blockchain.add_block(session, block)
             session.commit()
         except BlockchainError as e:
-            log.error(f'v1_block_add error [2]: {e!r}')
+            log.error(f'v1_block_add error [4]: {e!r}')
             session.rollback()
             response = {'status': 'error', 'message': str(e)}
-            return web.json_response(response)
+            return json_response(response)
         except Exception as e:
-            log.error(f'v1_block_add error [3]: {e!r}')
+            log.error(f'v1_block_add error [5]: {e!r}')
             session.rollback()
             response = {'status': 'error', 'message': 'system error'}
-            return web.json_response(response)
+            return json_response(response)
         finally:
             session.close()
             session = None
 
     response = {'status': 'success'}
-    return web.json_response(response)
+    return json_response(response)
+
+#
+# miner
+#
+@routes.get('/v1/miner/stats')
+@routes.post('/v1/miner/stats')
+async def v1_miner_stats(request):
+    response = {
+        'status': 'success',
+        'mining': not Config.NO_MINE,
+        'workers': Config.MINER_WORKERS,
+    }
+
+    response.update(miner.stats.to_dict())
+    return json_response(response)
+
 
 #
 # sync difficulty
@@ -511,7 +674,7 @@ async def v1_block_add(request):
 async def sync_difficulty():
     log.info('Started sync difficulty')
 
-    async with ClientSession() as client_session:
+    async with ClientSession(json_serialize=codec.dumps_str) as client_session:
         while True:
             # difficulty
             url = f'{Config.COORDINATOR}/v1/difficulty'
@@ -560,15 +723,25 @@ async def sync_blockchain():
         start = 0
 
     # sync with coordinator node
-    async with ClientSession() as client_session:
+    async with ClientSession(json_serialize=codec.dumps_str) as client_session:
         while True:
             url = f'{Config.COORDINATOR}/v1/block/get-range'
             data = {'start': start}
 
+            # coordinator which does not support binary wire format responds with json
+            if Config.WIRE_FORMAT == 'binary':
+                headers = {'Accept': f'{wire.CONTENT_TYPE}, application/json;q=0.5'}
+            else:
+                headers = {'Accept': 'application/json'}
+
             try:
-                async with client_session.post(url, json=data) as res:
-                    data = await res.json()
-                    # log.debug(data)
+                async with client_session.post(url, json=data, headers=headers) as res:
+                    if res.content_type == wire.CONTENT_TYPE:
+                        message = await res.read()
+                        data = {'status': 'success', 'blocks': message}
+                    else:
+                        data = await res.json()
+                        # log.debug(data)
             except Exception as e:
                 log.error(e)
                 await asyncio.sleep(10.0)
@@ -580,9 +753,15 @@ async def sync_blockchain():
                 await asyncio.sleep(10.0)
                 continue
 
+            # transactions of all blocks are verified in single batch
             try:
                 blocks = data['blocks']
-                blocks = [Block.from_dict(b) for b in blocks]
+                loop = asyncio.get_event_loop()
+
+                if isinstance(blocks, bytes):
+                    blocks = await loop.run_in_executor(None, Block.deserialize_wire_many, blocks)
+                else:
+                    blocks = await loop.run_in_executor(None, Block.from_dict_many, blocks)
             except BlockError as e:
                 # raise Block('could not create block')
                 log.warn('could not create block, retrying...')
@@ -633,9 +812,26 @@ async def sync_blockchain():
 async def mine_blocks():
     log.info('Started mining')
 
-    async with ClientSession() as client_session:
+    # block template is kept while chain tip and difficulty stay same,
+    # and all of its transactions are still in mempool, transactions which
+    # show up in mempool meanwhile are appended to it, so its merkle tree
+    # is only extended
+    template_generation = None
+    template_transactions = []
+    template_transactions_ids = set()
+    template_balances = {}
+    template_merkle = None
+
+    async with ClientSession(json_serialize=codec.dumps_str) as client_session:
         while True:
+            # block template becomes stale once chain tip or difficulty changes,
+            # mining is also interrupted periodically to pick up new transactions
+            generation = blockchain.get_generation()
+            refresh_time = time.monotonic() + TEMPLATE_REFRESH_INTERVAL
+            is_stale = lambda: blockchain.get_generation() != generation or time.monotonic() >= refresh_time
+
             # unconfirmed transactions
+            t = time.perf_counter()
             url = f'{Config.COORDINATOR}/v1/unconfirmed-transaction/get-range'
             # data = {'start': 0, 'end': 1000}
             data = {'start': 0, 'end': 200}
@@ -655,15 +851,39 @@ async def mine_blocks():
                 await asyncio.sleep(10.0)
                 continue
 
+            miner.stats.add_phase_time('fetch_unconfirmed_transactions', time.perf_counter() - t)
+
+            # transactions replaced, expired or dropped from mempool meanwhile
+            # would get block rejected, so template is rebuilt without them
+            unconfirmed_transactions_ids = set(n['id'] for n in data['unconfirmed_transactions'])
+
+            if template_generation == generation and not template_transactions_ids <= unconfirmed_transactions_ids:
+                log.debug('block template has transactions which left mempool, rebuilding it')
+                template_generation = None
+
+            if generation != template_generation:
+                template_generation = generation
+                template_transactions = []
+                template_transactions_ids = set()
+                template_balances = {}
+
+                # first leaf is reward transaction, which is known only after all fees
+                template_merkle = MerkleAccumulator()
+                template_merkle.add_leaf(bytes(32))
+
             log.debug(f'unconfirmed_transactions: {data["unconfirmed_transactions"]!r}')
 
-            # build transactions
+            # build transactions, which are not in block template yet
+            t = time.perf_counter()
             transactions = []
 
             async with session_lock:
                 session = Session()
 
                 for n in data['unconfirmed_transactions']:
+                    if n['id'] in template_transactions_ids:
+                        continue
+
                     # filter bad transactions
                     sender_address = n['sender_address']
                     recipient_address = n['recipient_address']
@@ -694,36 +914,40 @@ async def mine_blocks():
             # log.debug(f'transactions: {transactions!r}')
 
             # check balances
-            # skip transactions which do not have enough funds on sender_address
+            # skip transactions which do not have enough funds on sender_address,
+            # balances left by block template transactions are already known
             addresses = set([tx.sender_address for tx in transactions if tx.sender_address])
+            addresses -= set(template_balances)
             
             async with session_lock:
                 session = Session()
                 
-                addresses_balances = {
+                template_balances.update({
                     # a: blockchain.get_address_info(session, a)['confirmed_balance']
                     a: blockchain._get_address_info_confirmed_balance(session, a)
                     for a in addresses
-                }
+                })
 
                 session.close()
 
-            _transactions = []
-
             for tx in transactions:
-                confirmed_balance = addresses_balances[tx.sender_address]
+                confirmed_balance = template_balances[tx.sender_address]
 
                 if confirmed_balance < (tx.amount + tx.fee):
                     log.warn(f'not enough as balance, confirmed_balance: {confirmed_balance!r}, amount: {tx.amount!r}, fee: {tx.fee}')
                     continue
                 
                 confirmed_balance -= (tx.amount + tx.fee)
-                addresses_balances[tx.sender_address] = confirmed_balance
-                _transactions.append(tx)
+                template_balances[tx.sender_address] = confirmed_balance
+                template_transactions.append(tx)
+                template_transactions_ids.add(tx.id)
+                template_merkle.add_leaf(bytes.fromhex(tx.hash))
 
-            transactions = _transactions
+            transactions = list(template_transactions)
+            miner.stats.add_phase_time('check_balances', time.perf_counter() - t)
             
             # calculate allowed_reward_amount
+            t = time.perf_counter()
             allowed_reward_amount = blockchain.reward_amount
 
             for tx in transactions:
@@ -747,6 +971,10 @@ async def mine_blocks():
             reward_transaction.hash = reward_transaction.calc_hash()
             transactions = [reward_transaction] + transactions
 
+            # template keeps placeholder leaf, so it can be extended later
+            merkle_accumulator = template_merkle.copy()
+            merkle_accumulator.replace_first_leaf(bytes.fromhex(reward_transaction.hash))
+
             # previous block
             async with session_lock:
                 session = Session()
@@ -768,43 +996,73 @@ async def mine_blocks():
                 prev_hash=prev_block.hash if prev_block else None,
                 time_=Block.get_time_now(),
                 transactions=transactions,
-                merkle_root=None,
+                merkle_root=merkle_accumulator.get_merkle_root(),
                 difficulty=blockchain.difficulty,
                 nonce=None,
                 hash_=None,
                 check=False,
             )
 
+            miner.stats.add_phase_time('build_block', time.perf_counter() - t)
+
             # mine
             log.debug(f'block mining beginning: {block}')
-            block.mine()
+            t = time.perf_counter()
+            loop = asyncio.get_event_loop()
+            mined_block = await loop.run_in_executor(mining_executor, block.mine, Config.MINER_WORKERS, is_stale)
+            miner.stats.add_phase_time('nonce_search', time.perf_counter() - t)
+
+            if mined_block is None:
+                if blockchain.get_generation() == generation:
+                    log.debug('refreshing block template with new transactions')
+                    continue
+
+                miner.stats.add_block_aborted()
+                log.info('chain tip or difficulty changed, restarting mining on fresh block template')
+                continue
+
+            # transactions of found block are spent, whether it is accepted or not
+            template_generation = None
+            miner.stats.add_block_found()
             log.debug(f'block mining finihed: {block}')
 
             # submit just mined block
+            t = time.perf_counter()
+
             try:
                 status = await blockchain.submit_block(block)
             except BlockchainError as e:
+                miner.stats.add_block_rejected(miner.get_rejected_reason(str(e)))
                 log.warn('unsuccessful block submission [0], sleeping...')
                 log.error(e)
                 await asyncio.sleep(30.0)
                 continue
             except Exception as e:
+                miner.stats.add_block_rejected('http_error' if isinstance(e, (ClientError, asyncio.TimeoutError)) else 'other')
                 log.warn('unsuccessful block submission [1], sleeping...')
                 log.error(e)
                 await asyncio.sleep(30.0)
                 continue
+            finally:
+                miner.stats.add_phase_time('submit_block', time.perf_counter() - t)
 
             if not status:
+                miner.stats.add_block_rejected('other')
                 log.warn('unsuccessful block submission [2], sleeping...')
                 log.error(e)
                 await asyncio.sleep(30.0)
                 continue
 
+            miner.stats.add_block_submitted()
             await asyncio.sleep(5.0)
 
     log.info('Stopped mining')
 
 
+async def on_cleanup(app):
+    crypto.shutdown_verify_executor()
+
+
 # genesis block
 def create_genesis_block():
     session = Session()
@@ -886,10 +1144,115 @@ def create_genesis_block():
     log.warn('genesis block created')
 
 
+# v1 tables
+def migrate_v1_tables():
+    log.warn('migrating v1 tables')
+    n_rows = migrate.migrate_v1_tables()
+    log.warn(f'v1 tables migrated: {n_rows}')
+
+
+# volume rollups
+def rebuild_volume_rollups():
+    log.warn('rebuilding volume rollups')
+    session = Session()
+    blockchain.rebuild_volume_rollups(session)
+    session.commit()
+    session.close()
+    log.warn('volume rollups rebuilt')
+
+
+def check_volume_rollups():
+    session = Session()
+
+    if not blockchain.has_rollup(session, 'volume'):
+        log.warn('volume rollups are not built, use --rebuild-volume-rollups')
+    elif blockchain.check_volume_rollups(session):
+        log.info('volume rollups match transactions')
+    else:
+        log.error('volume rollups do not match transactions, use --rebuild-volume-rollups')
+
+    session.close()
+
+
+# address balances
+def rebuild_address_balances():
+    log.warn('rebuilding address balances')
+    session = Session()
+    blockchain.rebuild_address_balances(session)
+    session.commit()
+    session.close()
+    log.warn('address balances rebuilt')
+
+
+def check_address_balances():
+    session = Session()
+
+    if not blockchain.has_rollup(session, 'address_balance'):
+        log.warn('address balances are not built, use --rebuild-address-balances')
+    elif blockchain.check_address_balances(session):
+        log.info('address balances match transactions')
+    else:
+        log.error('address balances do not match transactions, use --rebuild-address-balances')
+
+    session.close()
+
+
+# chain counters
+def rebuild_chain_counters():
+    log.warn('rebuilding chain counters')
+    session = Session()
+    blockchain.rebuild_chain_counters(session)
+    session.commit()
+    session.close()
+    log.warn('chain counters rebuilt')
+
+
+def check_chain_counters():
+    session = Session()
+
+    if not blockchain.has_rollup(session, 'chain_counters'):
+        log.warn('chain counters are not built, use --rebuild-chain-counters')
+    elif blockchain.check_chain_counters(session):
+        log.info('chain counters match blocks and transactions')
+    else:
+        log.error('chain counters do not match blocks and transactions, use --rebuild-chain-counters')
+
+    session.close()
+
+
+# migrate v1 tables, node does not start on v2 tables
+# while v1 tables still have rows which are not migrated
+if Config.MIGRATE_V1_TABLES:
+    migrate_v1_tables()
+elif migrate.needs_migration():
+    log.error('database has v1 tables, use --migrate-v1-tables')
+    raise SystemExit(1)
+
 # create genesis block
 if Config.GENERATE_GENESIS_BLOCK:
     create_genesis_block()
 
+# rebuild and check volume rollups
+if Config.REBUILD_VOLUME_ROLLUPS:
+    rebuild_volume_rollups()
+
+if Config.CHECK_VOLUME_ROLLUPS:
+    check_volume_rollups()
+
+# rebuild and check address balances
+if Config.REBUILD_ADDRESS_BALANCES:
+    rebuild_address_balances()
+
+if Config.CHECK_ADDRESS_BALANCES:
+    check_address_balances()
+
+# rebuild and check chain counters
+if Config.REBUILD_CHAIN_COUNTERS:
+    rebuild_chain_counters()
+
+if Config.CHECK_CHAIN_COUNTERS:
+    check_chain_counters()
+
 # check mining address
 if not Config.MINER_ADDRESS:
     if os.path.exists('miner_key.json'):
@@ -909,6 +1272,9 @@ if not Config.MINER_ADDRESS:
 
     Config.MINER_ADDRESS = data['address']
 
+# signature verification workers, forked before node runs any thread
+crypto.start_verify_executor()
+
 # sync difficulty
 if Config.NO_SYNC:
     log.warn('Skipping difficulty sync')
@@ -930,6 +1296,7 @@ else:
 # web app
 app = web.Application()
 app.add_routes(routes)
+app.on_cleanup.append(on_cleanup)
 
 cors = aiohttp_cors.setup(app, defaults={
     "*": aiohttp_cors.ResourceOptions(